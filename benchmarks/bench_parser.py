@@ -0,0 +1,144 @@
+"""Офлайн-бенчмарк парсера: выдача, карточки компаний и выгрузка в Excel на локальных фикстурах
+
+Запуск из корня репозитория:
+    python benchmarks/bench_parser.py --pages 20 --repeat 3
+
+Сайт заменяется локальным HTTP-сервером (fixture_server.py), браузер - FakeDriver (fake_driver.py),
+поэтому результаты сравнимы между запусками и не зависят от checko.ru. Рабочие файлы парсера
+(кэш, база, логи) создаются во временной папке.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_driver import FakeDriver
+from fixture_server import FixtureSite, start_server
+
+
+@contextlib.contextmanager
+def measure(results, stage, units):
+    """Замер этапа: время, пиковая память (tracemalloc) и число обработанных единиц"""
+    counter = {'units': 0, 'records': 0}
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield counter
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({
+            'stage': stage,
+            'seconds': round(elapsed, 4),
+            units: counter['units'],
+            f"{units}_per_sec": round(counter['units'] / elapsed, 1) if elapsed else None,
+            'records': counter['records'],
+            'records_per_sec': round(counter['records'] / elapsed, 1) if elapsed else None,
+            'peak_mb': round(peak / 1024 / 1024, 2),
+        })
+
+
+def run_once(bcp, workdir, run_num):
+    """Один проход: сбор ссылок, разбор компаний, выгрузка книги Excel из хранилища"""
+    results = []
+    driver = FakeDriver()
+    quiet = open(os.devnull, 'w', encoding='utf-8')
+
+    # Кэш не должен подменять загрузку страниц между повторами
+    bcp.HTML_CACHE_DIR = os.path.join(workdir, f"cache_{run_num}")
+
+    with contextlib.redirect_stdout(quiet):
+        with measure(results, 'listing', 'pages') as counter:
+            driver.get(bcp.BASE_URL)
+            pages_before = driver.pages_loaded - 1
+            links = bcp.get_all_company_links(driver)
+            # Первая страница открыта до сбора, последняя - пустая выдача
+            counter['units'] = driver.pages_loaded - pages_before
+            counter['records'] = len(links)
+
+        records = []
+        with measure(results, 'companies', 'pages') as counter:
+            existing_inns = bcp.InnRegistry()
+            for link in links:
+                company_data = bcp.parse_company_page(driver, link, existing_inns)
+                if company_data and existing_inns.claim(company_data.inn):
+                    records.append(company_data)
+            counter['units'] = len(links)
+            counter['records'] = len(records)
+
+        # Выгрузка читает записи из хранилища, как в основном сценарии
+        month_name = f"bench {run_num}"
+        bcp.save_records(records, month_name)
+        with measure(results, 'excel', 'rows') as counter:
+            bcp.export_workbook(os.path.join(workdir, f"bench_{run_num}.xlsx"), [month_name])
+            counter['units'] = counter['records'] = len(records)
+
+    driver.quit()
+    quiet.close()
+    return results
+
+
+def print_report(runs):
+    print(f"{'этап':<10} {'сек':>8} {'стр/с':>9} {'записей/с':>10} {'пик МБ':>8}")
+    for run_num, results in enumerate(runs, 1):
+        print(f"-- проход {run_num}")
+        for r in results:
+            rate = r.get('pages_per_sec') or r.get('rows_per_sec') or 0
+            print(f"{r['stage']:<10} {r['seconds']:>8.3f} {rate:>9.1f} {r['records_per_sec'] or 0:>10.1f} {r['peak_mb']:>8.2f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарк парсера checko.ru")
+    arg_parser.add_argument('--pages', type=int, default=20, help="Число страниц выдачи (по 5 компаний)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="Число проходов")
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="Задержка ответа сервера, сек")
+    arg_parser.add_argument('--fetch', choices=('browser', 'http'), default='browser',
+                            help="Режим загрузки карточек (FETCH_MODE)")
+    arg_parser.add_argument('--json', help="Сохранить результаты в JSON для сравнения с другими запусками")
+    arg_parser.add_argument('--verbose', action='store_true', help="Не глушить лог парсера")
+    args = arg_parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # Парсер пишет логи и рабочие файлы в текущую папку - уводим их во временную
+    workdir = tempfile.mkdtemp(prefix='checko_bench_')
+    os.chdir(workdir)
+    import big_checko_parser as bcp
+
+    # Парсер импортирует тяжелые библиотеки при первом использовании - загружаем их заранее,
+    # чтобы время импорта не попадало в замеры этапов (его меряет bench_startup.py)
+    import bs4, openpyxl, requests  # noqa: F401
+
+    if not args.verbose:
+        bcp.logger.setLevel(logging.WARNING)
+
+    site = FixtureSite(pages=args.pages, latency=args.latency)
+    server, base_url = start_server(site)
+    bcp.SITE_URL = base_url
+    bcp.BASE_URL = f"{base_url}/search/advanced"
+    bcp.FETCH_MODE = args.fetch
+    bcp.REQUESTS_PER_SECOND = 1_000_000
+    bcp.DEBUG_MODE = 'off'
+    bcp.STORAGE_PATH = os.path.join(workdir, 'bench.sqlite3')
+
+    runs = [run_once(bcp, workdir, run_num) for run_num in range(1, args.repeat + 1)]
+    server.shutdown()
+
+    print(f"Фикстуры: {args.pages} стр. выдачи, загрузка карточек: {args.fetch}, рабочая папка: {workdir}")
+    print_report(runs)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'runs': runs}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Бенчмарк запуска: время импорта big_checko_parser и тяжелые библиотеки, загруженные при импорте
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py --repeat 10
+
+Каждый замер - отдельный процесс Python (python -X importtime), чтобы кэш модулей не искажал результат.
+Рабочие файлы, которые парсер создает при импорте (логи), пишутся во временную папку.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Библиотеки, которые парсер должен загружать только при первом использовании
+HEAVY_MODULES = ('pandas', 'selenium', 'bs4', 'openpyxl', 'requests', 'webdriver_manager', 'lxml', 'asyncio',
+                 'concurrent.futures')
+
+PROBE = f"""
+import sys, time
+sys.path.insert(0, {REPO_DIR!r})
+started = time.perf_counter()
+import big_checko_parser
+print(time.perf_counter() - started)
+print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def run_once(workdir):
+    """Один замер: (секунд на импорт, загруженные тяжелые модули, {модуль: накопленное время импорта, мкс})"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=workdir,
+                               capture_output=True, text=True, check=True)
+    seconds, loaded = completed.stdout.splitlines()[-2:]
+
+    # Строки importtime: "import time: self [us] | cumulative | imported package"
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line.split('|')
+        module = module.strip()
+        if '.' not in module:
+            cumulative[module] = max(cumulative.get(module, 0), int(cumulative_us))
+    return float(seconds), [name for name in loaded.split(',') if name], cumulative
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк времени импорта парсера checko.ru")
+    arg_parser.add_argument('--repeat', type=int, default=10, help="Число замеров")
+    arg_parser.add_argument('--top', type=int, default=10, help="Сколько самых долгих модулей показать")
+    arg_parser.add_argument('--json', help="Сохранить результаты в JSON для сравнения с другими запусками")
+    args = arg_parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='checko_startup_')
+    runs = [run_once(workdir) for _ in range(args.repeat)]
+    seconds = [run[0] for run in runs]
+    loaded = runs[-1][1]
+    cumulative = runs[-1][2]
+
+    print(f"Импорт big_checko_parser, {args.repeat} замеров: медиана {statistics.median(seconds) * 1000:.1f} мс, "
+          f"мин {min(seconds) * 1000:.1f} мс, макс {max(seconds) * 1000:.1f} мс")
+    print(f"Тяжелые библиотеки, загруженные при импорте: {', '.join(loaded) or 'нет'}")
+    print(f"{'модуль':<24} {'мс':>8}")
+    for module, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{module:<24} {us / 1000:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'seconds': seconds, 'heavy_modules_loaded': loaded,
+                       'top_modules_ms': {module: us / 1000 for module, us in
+                                          sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]}},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""Проверка извлечения полей компании на фикстурах: индекс страницы (PageIndex + COMPANY_SCHEMA)
+против прежнего разбора обходами дерева BeautifulSoup (soup.find / find_next) и извлечение в браузере
+(EXTRACT_COMPANY_JS) против извлечения в Python
+
+Запуск из корня репозитория:
+    python benchmarks/check_extraction.py --js node
+    python benchmarks/check_extraction.py --js chrome
+
+Каждое поле COMPANY_SCHEMA сверяется на каждой фикстуре company_*.html каждым доступным парсером HTML.
+EXTRACT_COMPANY_JS выполняется либо в Chrome на страницах локального сервера (fixture_server.py),
+либо в Node.js на дереве, которое построил html.parser (--js auto: node, если он установлен).
+При расхождении печатаются поле и оба значения, код выхода - 1.
+"""
+import argparse
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import start_server
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+
+
+def text_strip(element):
+    return element.get_text(strip=True)
+
+
+def reference_director(soup):
+    """Прежний get_person_info(soup, 'Генеральный директор')"""
+    try:
+        director = None
+        director_inn = None
+        is_director = lambda t: t and 'директор' in t.lower()
+        director_section = (soup.find('div', class_='fw-700', string=is_director) or
+                            soup.find('strong', class_='fw-700', string=is_director))
+        if director_section:
+            director_tag = director_section.find_next('a', class_='link')
+            if director_tag:
+                director = text_strip(director_tag)
+                director_inn_tag = director_section.find_next('span', {'class': 'copy'})
+                if director_inn_tag:
+                    director_inn = text_strip(director_inn_tag)
+            else:
+                parent_div = director_section.find_parent('div', class_='mb-3')
+                if parent_div:
+                    director_tag = parent_div.find('a', class_='link')
+                    if director_tag:
+                        director = text_strip(director_tag)
+                        director_inn_tag = parent_div.find('span', {'class': 'copy'})
+                        if director_inn_tag:
+                            director_inn = text_strip(director_inn_tag)
+        return director, director_inn
+    except Exception:
+        return '', ''
+
+
+def reference_founder(soup):
+    """Прежний get_person_info(soup, 'Учредитель')"""
+    try:
+        founder = None
+        founder_inn = None
+        founder_section = soup.find('section', id='founders')
+        founder_table = founder_section.find('table', class_='table table-md') if founder_section else None
+        rows = founder_table.find_all('tr') if founder_table else None
+        if rows:
+            columns = rows[1].find_all('td')
+            founder_tag = columns[1].find('a') if len(columns) >= 2 else None
+            if founder_tag:
+                founder = text_strip(founder_tag)
+                if "Показать на карте" in founder:
+                    return '', ''
+                inn_div = columns[1].find_next('div')
+                if inn_div and "ИНН" in inn_div.text:
+                    founder_inn = inn_div.text.split()[-1]
+
+        if not founder:
+            founder_section = (soup.find('strong', class_='fw-700', string='Учредитель') or
+                               soup.find('div', class_='fw-700', string='Учредитель'))
+            if founder_section:
+                founder_tag = founder_section.find_next('a', class_='link')
+                if founder_tag:
+                    founder = text_strip(founder_tag)
+                else:
+                    parent_div = founder_section.find_parent('div', class_='mb-3')
+                    if parent_div:
+                        address_divs = parent_div.find_all('div', recursive=False)
+                        if len(address_divs) > 0 and 'Субъект РФ' not in address_divs[0].get_text():
+                            founder = parent_div.get_text(strip=True).replace('Учредитель', '').strip()
+                        elif len(address_divs) > 0:
+                            founder = None
+        return founder, founder_inn
+    except Exception:
+        return '', ''
+
+
+def reference_okved(soup):
+    """Прежний get_first_okved"""
+    try:
+        section = soup.find('section', id='activity')
+        if section:
+            table = section.find('table', class_='table table-sm table-striped')
+            rows = table.find_all('tr') if table else None
+            if not rows:
+                return None, None
+            columns = rows[0].find_all('td')
+            return columns[0].text.strip(), columns[1].text.strip()
+    except Exception:
+        return None, None
+
+
+def reference_phones(soup):
+    phones = []
+    for div in soup.find_all('div', class_='col-12 col-lg-4'):
+        if 'Телефон' in div.get_text():
+            for link in div.find_all('a', href=lambda x: x and x.startswith('tel:')):
+                phone = text_strip(link)
+                if phone and phone not in phones:
+                    phones.append(phone)
+    return ', '.join(phones) if phones else None
+
+
+def reference_next_text(soup, label):
+    tag = soup.find('div', string=label)
+    return text_strip(tag.find_next('div')) if tag else None
+
+
+# Прежний разбор по полям схемы: имя поля схемы -> функция soup -> кортеж значений ее полей
+REFERENCE = {
+    'inn': lambda soup: (text_strip(tag) if (tag := soup.find('strong', id='copy-inn')) else None,),
+    'date': lambda soup: (reference_next_text(soup, 'Дата регистрации'),),
+    'director': reference_director,
+    'founder': reference_founder,
+    'phones': lambda soup: (reference_phones(soup),),
+    'email': lambda soup: (text_strip(tag) if (tag := soup.find(
+        'a', href=lambda x: x and x.startswith('mailto:'))) else None,),
+    'okved': reference_okved,
+    'address': lambda soup: (text_strip(tag) if (tag := soup.find('span', id='copy-address')) else None,),
+    'capital': lambda soup: (reference_next_text(soup, 'Уставный капитал'),),
+}
+
+
+def outcome(extract, argument):
+    """Значения полей или имя исключения - разбор страницы должен падать одинаково"""
+    try:
+        return tuple(extract(argument))
+    except Exception as e:
+        return f"исключение {type(e).__name__}"
+
+
+def check_index(bcp, pages, parsers):
+    """Сверка COMPANY_EXTRACTORS с прежним разбором; возвращает список расхождений"""
+    mismatches = []
+    for name, html in pages.items():
+        for parser in parsers:
+            # Прежний разбор и индекс - на разных деревьях, чтобы ни один не видел изменений другого
+            index = bcp.PageIndex(bcp.make_soup(html, parser))
+            soup = bcp.make_soup(html, parser)
+            for field, field_names, extract in bcp.COMPANY_EXTRACTORS:
+                actual = outcome(extract, index)
+                expected = outcome(REFERENCE[field], soup)
+                if actual != expected:
+                    mismatches.append(f"{name} [{parser}] {field} {field_names}: индекс {actual!r}, "
+                                      f"прежний разбор {expected!r}")
+    return mismatches
+
+
+# Минимальный DOM для EXTRACT_COMPANY_JS в Node.js: узлы из JSON-дерева BeautifulSoup и только те
+# свойства, которыми пользуется скрипт (childNodes, children, parentElement, getAttribute, getElementsByTagName)
+NODE_DOM_JS = r"""
+const fs = require('fs');
+class Node {
+  constructor(nodeType, parent) { this.nodeType = nodeType; this.parentElement = parent; this.childNodes = []; }
+  get children() { return this.childNodes.filter(child => child.nodeType === 1); }
+  getAttribute(name) { return name in this.attrs ? this.attrs[name] : null; }
+  getElementsByTagName(name) {
+    const out = [];
+    const walk = el => {
+      for (const child of el.children) {
+        if (name === '*' || child.tagName.toLowerCase() === name) out.push(child);
+        walk(child);
+      }
+    };
+    walk(this);
+    return out;
+  }
+}
+const build = (data, parent) => {
+  const node = new Node(data.type, parent && parent.tagName ? parent : null);
+  if (data.type !== 1) {
+    node.data = data.data;
+    return node;
+  }
+  node.tagName = data.name.toUpperCase();
+  node.attrs = data.attrs;
+  node.childNodes = data.children.map(child => build(child, node));
+  return node;
+};
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const extract = new Function('document', input.script);
+console.log(JSON.stringify(input.pages.map(page => extract(build(page, null)))));
+"""
+
+
+def dom_tree(node):
+    """Дерево BeautifulSoup в JSON для NODE_DOM_JS: элементы (1), текст (3), комментарии (8)"""
+    from bs4 import Comment, Doctype, NavigableString
+    if isinstance(node, Doctype):
+        return None
+    if isinstance(node, NavigableString):
+        return {'type': 8 if isinstance(node, Comment) else 3, 'data': str(node)}
+    attrs = {key: ' '.join(value) if isinstance(value, list) else value for key, value in node.attrs.items()}
+    children = [child for child in map(dom_tree, node.children) if child]
+    return {'type': 1, 'name': node.name, 'attrs': attrs, 'children': children}
+
+
+def js_fields_node(bcp, pages):
+    """Результаты EXTRACT_COMPANY_JS в Node.js: {фикстура: (поля, HTML, разобранный в Python)}"""
+    documents = []
+    for html in pages.values():
+        # Корень - документ без тега, как BeautifulSoup: getElementsByTagName('*') начинается с <html>
+        root = dom_tree(bcp.make_soup(html, 'html.parser'))
+        documents.append({**root, 'name': '#document'})
+    completed = subprocess.run(['node', '-e', NODE_DOM_JS], input=json.dumps({
+        'script': bcp.EXTRACT_COMPANY_JS, 'pages': documents}), capture_output=True, text=True, check=True)
+    return {name: (fields, html) for (name, html), fields in zip(pages.items(), json.loads(completed.stdout))}
+
+
+class PagesSite:
+    """Сайт для fixture_server: фикстура по адресу /company/<имя файла>"""
+    latency = 0.0
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def render(self, path):
+        return self.pages.get(path[len('/company/'):]) if path.startswith('/company/') else None
+
+
+def js_fields_chrome(bcp, pages):
+    """Результаты EXTRACT_COMPANY_JS в Chrome; Python разбирает page_source, как режим 'verify'"""
+    server, base_url = start_server(PagesSite(pages))
+    driver = bcp.setup_driver()
+    try:
+        results = {}
+        for name in pages:
+            driver.get(f"{base_url}/company/{name}")
+            results[name] = (driver.execute_script(bcp.EXTRACT_COMPANY_JS), driver.page_source)
+        return results
+    finally:
+        driver.quit()
+        server.shutdown()
+
+
+def python_fields(bcp, html):
+    """Поля схемы, извлеченные в Python; error - исключение разбора (в JS - поле error)"""
+    index = bcp.PageIndex(bcp.make_soup(html, 'html.parser'))
+    fields = {'error': None}
+    for _, field_names, extract in bcp.COMPANY_EXTRACTORS:
+        try:
+            fields.update(zip(field_names, extract(index)))
+        except Exception as e:
+            fields['error'] = f"{type(e).__name__}: {e}"
+            break
+    return fields
+
+
+def check_js(bcp, results):
+    """Сверка полей EXTRACT_COMPANY_JS с извлечением в Python; возвращает список расхождений"""
+    field_names = [name for _, names, _ in bcp.COMPANY_EXTRACTORS for name in names]
+    mismatches = []
+    for name, (actual, html) in results.items():
+        expected = python_fields(bcp, html)
+        if expected['error'] or actual['error']:
+            # Страница с ошибкой разбора: ошибка должна быть с обеих сторон, а ИНН - совпадать
+            if not (expected['error'] and actual['error']) or expected['inn'] != actual['inn']:
+                mismatches.append(f"{name} [js] ошибка разбора: Python {expected['error']!r}, "
+                                  f"JS {actual['error']!r}")
+            continue
+        for field in field_names:
+            if expected.get(field) != actual.get(field):
+                mismatches.append(f"{name} [js] {field}: Python {expected.get(field)!r}, JS {actual.get(field)!r}")
+    return mismatches
+
+
+def load_pages():
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, 'company_*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Проверка извлечения полей компании на фикстурах")
+    arg_parser.add_argument('--js', choices=('auto', 'node', 'chrome', 'off'), default='auto',
+                            help="Где выполнять EXTRACT_COMPANY_JS для сверки с Python")
+    args = arg_parser.parse_args()
+    js = args.js
+    if js == 'auto':
+        js = 'node' if shutil.which('node') else 'off'
+
+    # Парсер пишет логи в текущую папку - уводим их во временную
+    os.chdir(tempfile.mkdtemp(prefix='checko_check_'))
+    import big_checko_parser as bcp
+    bcp.logger.setLevel(logging.CRITICAL)
+
+    missing = sorted(set(REFERENCE) ^ {field for field, _, _ in bcp.COMPANY_EXTRACTORS})
+    if missing:
+        print(f"Поля схемы без прежнего разбора (или лишние): {missing}")
+        return 1
+
+    pages = load_pages()
+    parsers = ['html.parser'] + (['lxml'] if importlib.util.find_spec('lxml') else [])
+    with contextlib.redirect_stdout(io.StringIO()):
+        mismatches = check_index(bcp, pages, parsers)
+
+    for line in mismatches:
+        print(line)
+    print(f"Индекс страницы: {len(pages)} фикстур x {len(bcp.COMPANY_EXTRACTORS)} полей, "
+          f"парсеры: {', '.join(parsers)}, расхождений: {len(mismatches)}")
+
+    if js == 'off':
+        print("JS-извлечение не проверялось: node не найден или --js off (для Chrome - --js chrome)")
+        return 1 if mismatches else 0
+
+    results = js_fields_node(bcp, pages) if js == 'node' else js_fields_chrome(bcp, pages)
+    with contextlib.redirect_stdout(io.StringIO()):
+        js_mismatches = check_js(bcp, results)
+    for line in js_mismatches:
+        print(line)
+    print(f"JS ({js}) против Python: {len(pages)} фикстур, расхождений: {len(js_mismatches)}")
+    return 1 if mismatches or js_mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
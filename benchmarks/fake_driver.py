@@ -0,0 +1,112 @@
+"""Замена Selenium WebDriver для бенчмарков: загружает страницы по HTTP и ищет элементы через BeautifulSoup"""
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.webdriver.common.by import By
+
+
+class FakeElement:
+    """Найденный элемент; после перехода на другую страницу становится устаревшим, как в браузере"""
+
+    def __init__(self, driver, tag):
+        self._driver = driver
+        self._tag = tag
+        self._generation = driver.generation
+
+    def _check(self):
+        if self._generation != self._driver.generation:
+            raise StaleElementReferenceException('element is not attached to the page document')
+
+    @property
+    def text(self):
+        self._check()
+        return self._tag.get_text(strip=True)
+
+    def get_attribute(self, name):
+        self._check()
+        value = self._tag.get(name)
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def is_enabled(self):
+        self._check()
+        return True
+
+    def is_displayed(self):
+        self._check()
+        return True
+
+    def click(self):
+        self._check()
+
+    def clear(self):
+        self._check()
+
+    def send_keys(self, *keys):
+        self._check()
+
+
+class FakeDriver:
+    """Минимальный WebDriver: get, page_source, find_element(s), execute_script, скриншоты, cookies"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.generation = 0
+        self.current_url = None
+        self.page_source = ''
+        self.pages_loaded = 0
+        self.bytes_loaded = 0
+        self._soup = None
+
+    def get(self, url):
+        response = self.session.get(url, timeout=15)
+        response.encoding = response.encoding or 'utf-8'
+        self.current_url = url
+        self.page_source = response.text
+        self.generation += 1
+        self.pages_loaded += 1
+        self.bytes_loaded += len(response.content)
+        self._soup = None
+
+    def _tree(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.page_source, 'html.parser')
+        return self._soup
+
+    def find_elements(self, by=By.ID, value=None):
+        if by == By.ID:
+            tags = self._tree().find_all(id=value)
+        elif by == By.CSS_SELECTOR:
+            tags = self._tree().select(value)
+        elif by == By.CLASS_NAME:
+            tags = self._tree().find_all(class_=value)
+        elif by == By.TAG_NAME:
+            tags = self._tree().find_all(value)
+        else:
+            raise NotImplementedError(f"FakeDriver не поддерживает поиск {by}")
+        return [FakeElement(self, tag) for tag in tags]
+
+    def find_element(self, by=By.ID, value=None):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"{by}={value}")
+        return elements[0]
+
+    def execute_script(self, script, *args):
+        if 'document.readyState' in script:
+            return 'complete'
+        return None
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+    def get_screenshot_as_png(self):
+        return b''
+
+    def save_screenshot(self, filename):
+        return True
+
+    def get_cookies(self):
+        return [{'name': cookie.name, 'value': cookie.value} for cookie in self.session.cookies]
+
+    def quit(self):
+        self.session.close()
@@ -0,0 +1,86 @@
+"""Локальная замена checko.ru для бенчмарков: страницы выдачи и компаний из записанных фикстур"""
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Варианты верстки карточки компании (разные блоки директора/учредителя, отсутствующие секции)
+COMPANY_FIXTURES = (
+    'company_full.html',
+    'company_strong_director.html',
+    'company_legal_founder.html',
+    'company_missing_sections.html',
+    'company_no_contacts.html',
+)
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FixtureSite:
+    """Содержимое сайта: pages страниц выдачи, ссылки на компании уникальны для каждой страницы"""
+
+    def __init__(self, pages=20, latency=0.0):
+        self.pages = pages
+        self.latency = latency
+        self.listing = load_fixture('listing_page.html')
+        self.listing_empty = load_fixture('listing_empty.html')
+        self.companies = [load_fixture(name) for name in COMPANY_FIXTURES]
+
+    def listing_page(self, page_num):
+        if page_num > self.pages:
+            return self.listing_empty
+        counter = iter(range(1, 1000))
+        return re.sub(r'href="/company/[^"]+"',
+                      lambda m: f'href="/company/p{page_num}-{next(counter)}"', self.listing)
+
+    def company_page(self, slug):
+        match = re.fullmatch(r'p(\d+)-(\d+)', slug)
+        if not match:
+            return None
+        page_num, position = int(match.group(1)), int(match.group(2))
+        html = self.companies[(position - 1) % len(self.companies)]
+        # Уникальный ИНН на каждую карточку, иначе все записи отсеются как дубликаты
+        inn = f"{page_num:06d}{position:04d}"
+        return re.sub(r'(<strong id="copy-inn">)\d+', rf'\g<1>{inn}', html)
+
+    def render(self, url):
+        parsed = urlparse(url)
+        if parsed.path == '/search/advanced':
+            page_num = int(parse_qs(parsed.query).get('page', ['1'])[0])
+            return self.listing_page(page_num)
+        if parsed.path.startswith('/company/'):
+            return self.company_page(parsed.path[len('/company/'):])
+        return None
+
+
+def start_server(site, port=0):
+    """Запуск HTTP-сервера в фоновом потоке; возвращает (сервер, адрес сайта)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if site.latency:
+                time.sleep(site.latency)
+            html = site.render(self.path)
+            if html is None:
+                self.send_error(404)
+                return
+            body = html.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
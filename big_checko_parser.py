@@ -1,20 +1,27 @@
+import abc
+import argparse
+import bisect
+import csv
+import gzip
+import hashlib
+import importlib.util
+import itertools
 import json
 import os
+import queue
 import random
+import re
+import socket
+import sqlite3
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
-import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver import Keys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
 import logging
+# pandas, selenium, requests, bs4, openpyxl, asyncio и concurrent.futures импортируются в функциях, где они нужны:
+# запуск без работы для браузера и утилиты, которым нужен только разбор страниц, не тратят время на их загрузку
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,54 +34,780 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Отдельный лог длительности ожиданий: шаг, секунды, результат (файл latency.log открывается
+# при первом ожидании, так что утилиты, которым нужен только разбор страниц, его не создают)
+latency_logger = logging.getLogger(f"{__name__}.latency")
+latency_logger.propagate = False
+_latency_lock = threading.Lock()
+
 # Конфигурация
-BASE_URL = "https://checko.ru/search/advanced"
+SITE_URL = "https://checko.ru"
+BASE_URL = f"{SITE_URL}/search/advanced"
 PAGE_LOAD_TIMEOUT = 30
-MAX_RETRIES = 3
+MAX_RETRIES = 3  # Повторов загрузки страницы после сбоя, дальше она откладывается в dead letters
+# Базовая задержка повтора по типу сбоя, сек: растет вдвое с каждой попыткой, со случайным разбросом.
+# Сбои других типов (например, ошибки разбора) сразу не повторяются, но тоже попадают в dead letters
+RETRY_BACKOFF = {'timeout': 2, 'no_inn': 5, 'driver': 1, 'captcha': 30, 'filter': 5}
+RETRY_BACKOFF_MAX = 120
+# Отложенные ссылки и окна выдачи хранятся в SQLite и повторяются пакетом в конце запуска (и следующих запусков)
+DEAD_LETTER_RETRY = True
+DEAD_LETTER_MAX_ATTEMPTS = 5  # После стольких неудачных пакетов повтора (первый сбой не в счет) запись больше не повторяется
+MAX_LISTING_PAGES = 999  # Сколько страниц выдачи листать в одном окне
+CHROME_BINARY = '/usr/bin/google-chrome'
+CHROMEDRIVER_PATH = '/usr/local/bin/chromedriver'
 DELAY_BETWEEN_PAGES = 2  # Задержка между страницами в секундах
 API_KEY = os.getenv('API_KEY')  # API ключ для rucaptcha
 SMTPBZ_API_KEY = os.getenv('SMTPBZ_API_KEY')
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Хранилище записей: SQLite с уникальным индексом по ИНН, xlsx выгружается из него по запросу
+STORAGE_PATH = 'checko.sqlite3'
+EXPORT_RESULTS = True  # Выгружать результаты, если запуск добавил записи (csv - только эти месяцы; все - ключ --export)
+OUTPUT_DIR = '.'
+OUTPUT_FORMAT = 'xlsx'  # 'xlsx' - одна книга OUTPUT_WORKBOOK, 'csv' - файл на каждый месяц
+OUTPUT_WORKBOOK = 'checko.xlsx'  # Сводная книга: лист со сводкой и лист на каждый месяц
+OUTPUT_FILENAME = '{month}.{format}'  # Имя файла выгрузки месяца
+# Поток записей: каждая новая компания сразу дописывается в файл ('jsonl', 'csv' или None - только хранилище)
+RECORD_SINK = 'jsonl'
+RECORD_SINK_PATH = 'records.{format}'
+RECORD_SINK_FSYNC_EVERY = 50  # fsync файла каждые N записей (flush - после каждой, чтобы файл можно было читать tail -f)
+# Известные по прошлым запускам компании (адрес -> ИНН) не загружаются повторно;
+# None - никогда, иначе компании старше стольких дней проверяются заново
+KNOWN_COMPANY_MAX_AGE_DAYS = None
+
+# Журнал прогресса для продолжения прерванного запуска (--resume)
+CHECKPOINT_PATH = 'checkpoint.jsonl'
+CHECKPOINT_FSYNC_EVERY = 20  # Сбрасывать журнал на диск каждые N событий
+
+# Поля записи компании и столбцы хранилища
+RECORD_COLUMNS = {
+    'ИНН': 'inn',
+    'Дата регистрации': 'registration_date',
+    'Ген. директор': 'director',
+    'ИНН директора': 'director_inn',
+    'Учредитель': 'founder',
+    'ИНН учредителя': 'founder_inn',
+    'Телефон': 'phone',
+    'Email': 'email',
+    'ОКВЭД': 'okved',
+    'Юридический адрес': 'legal_address',
+    'Уставной капитал': 'charter_capital',
+    'URL': 'url',
+    'Дата добавления': 'added_at',
+    'EmailSent': 'email_sent',
+}
+
+# Адаптивное разбиение: окно (месяц -> недели -> дни) делится, пока выдача больше порогов
+ADAPTIVE_SHARDING = True
+SHARD_MAX_RESULTS = 1000  # Максимум компаний в одном окне
+SHARD_MAX_PAGES = 50  # Максимум страниц выдачи в одном окне
+
+# Метрики запуска: текстовый файл для node_exporter (textfile collector) и JSON-сводка по каждому запуску
+METRICS_DIR = 'metrics'
+METRICS_PROM_FILE = 'checko_parser.prom'
+
+# Отладка: 'off' - ничего не сохранять, 'errors' - только при ошибках,
+# 'sampled' - при ошибках и на доле DEBUG_SAMPLE_RATE обычных шагов, 'all' - на каждом шаге
+DEBUG_MODE = 'errors'
+DEBUG_SAMPLE_RATE = 0.01
+DEBUG_DIR = 'debug'
+DEBUG_RING_SIZE = 20  # Сколько последних страниц и скриншотов держать в памяти для сброса при ошибке
+
+# Верхние границы ожиданий по шагам в секундах: ожидание заканчивается, как только условие выполнено
+WAIT_TIMEOUTS = {
+    'filter_panel': PAGE_LOAD_TIMEOUT,  # Загрузка страницы поиска с панелью фильтров
+    'filter_inputs': 10,  # Раскрытие блока "Дата регистрации"
+    'date_input': 5,  # Очистка и ввод даты в поле
+    'filter_results': 30,  # Обновление выдачи после "Применить"
+    'listing_page': PAGE_LOAD_TIMEOUT,  # Загрузка страницы выдачи
+    'company_page': PAGE_LOAD_TIMEOUT,  # Появление данных или капчи на странице компании
+    'copy_inn': 20,  # Появление ИНН после капчи
+    'scroll': 5,  # Готовность страницы после прокрутки
+}
+WAIT_POLL_INTERVAL = 0.1  # Как часто проверять условие ожидания
+
+# Загрузка страниц компаний: 'http' - через requests, браузер только если страница без данных или с капчей;
+# 'browser' - всегда через браузер
+FETCH_MODE = 'http'
+HTTP_TIMEOUT = 15  # Таймаут HTTP-запроса в секундах
+HTTP_POOL_SIZE = 10  # Размер пула соединений сессии
+
+# Браузеру нужен только текст DOM: тяжелые ресурсы не загружаем (CDP Network.setBlockedURLs)
+# Набор блокируемых категорий; 'styles' по умолчанию выключен - без CSS может поменяться видимость элементов фильтра
+BLOCK_RESOURCES = ('images', 'fonts', 'media', 'maps', 'analytics', 'ads')
+BLOCKED_URL_PATTERNS = {
+    'images': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico'],
+    'fonts': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.mp3'],
+    'styles': ['*.css'],
+    'maps': ['*api-maps.yandex.ru*', '*maps.googleapis.com*', '*tile.openstreetmap.org*'],
+    'analytics': ['*mc.yandex.ru*', '*google-analytics.com*', '*googletagmanager.com*', '*top-fwz1.mail.ru*'],
+    'ads': ['*an.yandex.ru*', '*yandex.ru/ads/*', '*doubleclick.net*', '*googlesyndication.com*'],
+}
+# 'eager' - driver.get возвращается после разбора DOM, не дожидаясь картинок и iframe; 'normal' - полная загрузка
+PAGE_LOAD_STRATEGY = 'eager'
+
+# Параллельная работа: каждый воркер - отдельный браузер со своим профилем и портом отладки
+WORKERS = 1
+DEBUG_PORT_BASE = 9222  # Порт воркера = DEBUG_PORT_BASE + номер воркера
+PROFILES_DIR = 'profiles'
+LINKS_CHUNK_SIZE = 50  # Сколько ссылок на компании отдается воркеру за раз
+
+# Плановая замена браузера: долго живущий Chrome растет в памяти и замедляется (None - без ограничения)
+DRIVER_RECYCLE_PAGES = 500  # Заменить браузер после N загрузок страниц
+DRIVER_MAX_RSS_MB = 1500  # ... или если процессы браузера заняли больше памяти (по /proc, только Linux)
+DRIVER_RSS_CHECK_EVERY = 20  # Проверять память каждые N загрузок
+DRIVER_MAX_PAGE_LATENCY = 10  # ... или если средняя загрузка последних DRIVER_LATENCY_WINDOW страниц дольше, сек
+DRIVER_LATENCY_WINDOW = 20
+# Запасной браузер запускается заранее, и замена не ждет старта Chrome (зато на воркер два процесса браузера)
+DRIVER_WARM_STANDBY = True
+STANDBY_PORT_OFFSET = 100  # Порт запасного браузера = порт воркера + STANDBY_PORT_OFFSET
+
+# Работа нескольких машин над одним обходом: задачи окно -> страница выдачи -> компания в общей очереди (--queue).
+# SQLiteTaskQueue - файл на общем диске; для сетевого хранилища достаточно своего класса с интерфейсом TaskQueue
+NODE_ID = None  # Имя узла в арендах задач (None - имя хоста и PID)
+TASK_LEASE_SECONDS = 300  # Аренда задачи: не продленная вовремя (узел упал) задача возвращается в очередь
+TASK_HEARTBEAT_SECONDS = 60  # Как часто узел продлевает аренду выполняемой задачи
+TASK_MAX_ATTEMPTS = 5  # После стольких неудачных аренд задача помечается failed
+QUEUE_POLL_INTERVAL = 5  # Пауза, когда свободных задач нет, но другие узлы еще работают (и могут добавить новые)
+# Признаки потерянной сессии в ошибках WebDriver: браузер упал или закрыт, его нужно заменить
+DEAD_SESSION_MARKERS = (
+    'invalid session id', 'no such session', 'session deleted', 'chrome not reachable', 'disconnected',
+    'tab crashed', 'target window already closed', 'max retries exceeded', 'connection refused',
+    'connection aborted',
+)
+
+# Ограничение нагрузки на сайт: общий лимит запросов в секунду для всех потоков (token bucket)
+REQUESTS_PER_SECOND = 0.5
+RATE_LIMIT_BURST = 1  # Сколько запросов можно сделать подряд без ожидания
+
+# Асинхронный конвейер загрузка -> разбор -> запись для страниц компаний (только при FETCH_MODE = 'http')
+ASYNC_PIPELINE = True
+FETCH_CONCURRENCY = 8  # Одновременных HTTP-запросов (темп все равно задает REQUESTS_PER_SECOND)
+PARSE_WORKERS = os.cpu_count() or 1  # Процессов для разбора HTML
+PIPELINE_QUEUE_SIZE = 100  # Максимум загруженных, но еще не разобранных страниц
+# Извлечение данных со страницы компании в браузере: 'python' - page_source разбирается BeautifulSoup;
+# 'js' - поля собираются одним вызовом JS в странице, HTML не передается (и не попадает в кэш);
+# 'verify' - оба способа, расхождения пишутся в лог, в запись идет результат Python
+EXTRACTION_MODE = 'python'
+# Парсер HTML: lxml в разы быстрее встроенного html.parser, используем его, если установлен
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# Период парсинга (месяцы обходятся от START_MONTH назад до END_MONTH)
+START_MONTH = datetime(2025, 5, 1)
+END_MONTH = datetime(2025, 1, 1)
+
+# Инкрементальный режим (--incremental): по дням от последней обработанной даты регистрации (watermark) до сегодня
+WATERMARK_OVERLAP_DAYS = 2  # Сколько дней до watermark пройти заново: компании появляются на сайте с задержкой
+INCREMENTAL_INITIAL_DAYS = 7  # Сколько дней пройти в первом инкрементальном запуске, пока watermark нет
+
+# Кэш загруженных страниц на диске
+HTML_CACHE_DIR = 'cache'
+HTML_CACHE_TTL = 7 * 24 * 3600  # Срок жизни страницы компании в кэше, секунд
+HTML_CACHE_LISTING_TTL = 24 * 3600  # Срок жизни страницы выдачи (она пополняется новыми компаниями)
+HTML_CACHE_MAX_BYTES = 2 * 1024 ** 3  # При превышении удаляются самые старые страницы
+HTML_CACHE_EVICT_EVERY = 500  # Проверка размера кэша после каждых N записей
+
+
+class Metrics:
+    """Гистограммы длительности этапов и счетчики событий за запуск (потокобезопасно)"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}  # этап -> {'buckets': [...], 'count', 'sum', 'max'}
+        self._counters = {}  # (имя, ((метка, значение), ...)) -> значение
+        self.started = datetime.now()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(
+                stage, {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0})
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def drain(self):
+        """Забрать накопленные данные и начать заново (для передачи из процесса разбора в основной)"""
+        with self._lock:
+            snapshot = (self._stages, self._counters)
+            self._stages, self._counters = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        stages, counters = snapshot
+        with self._lock:
+            for stage, other in stages.items():
+                entry = self._stages.setdefault(
+                    stage, {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0})
+                entry['buckets'] = [a + b for a, b in zip(entry['buckets'], other['buckets'])]
+                entry['count'] += other['count']
+                entry['sum'] += other['sum']
+                entry['max'] = max(entry['max'], other['max'])
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def _quantile(self, entry, q):
+        """Оценка квантиля по корзинам гистограммы (верхняя граница корзины)"""
+        target = q * entry['count']
+        for bound, count in zip(self.BUCKETS, entry['buckets']):
+            if count >= target:
+                return bound
+        return entry['max']
+
+    def to_prometheus(self):
+        """Текст в формате Prometheus exposition"""
+        with self._lock:
+            lines = ['# HELP checko_stage_seconds Длительность этапов парсера',
+                     '# TYPE checko_stage_seconds histogram']
+            for stage, entry in sorted(self._stages.items()):
+                for bound, count in zip(self.BUCKETS, entry['buckets']):
+                    lines.append(f'checko_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'checko_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+                lines.append(f'checko_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+                lines.append(f'checko_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in declared:
+                    lines.append(f'# TYPE checko_{name}_total counter')
+                    declared.add(name)
+                label_text = ','.join(f'{label}="{label_value}"' for label, label_value in labels)
+                lines.append(f'checko_{name}_total{{{label_text}}} {value}')
+
+            lines.append('# TYPE checko_run_started_timestamp_seconds gauge')
+            lines.append(f'checko_run_started_timestamp_seconds {self.started.timestamp():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Сводка запуска: по этапам - количество, сумма, среднее, p50/p95, максимум; счетчики"""
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': entry['count'],
+                    'total_seconds': round(entry['sum'], 3),
+                    'avg_seconds': round(entry['sum'] / entry['count'], 4) if entry['count'] else 0,
+                    'p50_seconds': self._quantile(entry, 0.5),
+                    'p95_seconds': self._quantile(entry, 0.95),
+                    'max_seconds': round(entry['max'], 4),
+                }
+                for stage, entry in sorted(self._stages.items())
+            }
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ','.join(f'{label}={label_value}' for label, label_value in labels)
+                counters[f"{name}{{{label_text}}}" if label_text else name] = value
+        return {
+            'started': self.started.strftime('%Y-%m-%d %H:%M:%S'),
+            'finished': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'stages': stages,
+            'counters': counters,
+        }
+
+
+METRICS = Metrics()
+
+
+def write_metrics():
+    """Запись метрик: .prom для textfile collector и JSON-сводка запуска (атомарно, через временный файл)"""
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        files = {
+            METRICS_PROM_FILE: METRICS.to_prometheus(),
+            f"run_{METRICS.started.strftime('%Y%m%d_%H%M%S')}.json":
+                json.dumps(METRICS.summary(), ensure_ascii=False, indent=2),
+        }
+        for name, content in files.items():
+            path = os.path.join(METRICS_DIR, name)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(f"{path}.tmp", path)
+    except Exception as e:
+        logger.error(f"Ошибка записи метрик: {str(e)}")
+
+
+class InnRegistry:
+    """Множество уже обработанных ИНН, общее для всех воркеров"""
+
+    def __init__(self, inns=()):
+        self._inns = set(inns)
+        self._lock = threading.Lock()
+
+    def __contains__(self, inn):
+        with self._lock:
+            return inn in self._inns
 
+    def __len__(self):
+        with self._lock:
+            return len(self._inns)
 
-def setup_driver():
-    """Настройка веб-драйвера для работы на VPS"""
+    def add(self, inn):
+        with self._lock:
+            self._inns.add(inn)
+
+    def claim(self, inn):
+        """Атомарно добавляет ИНН; False, если его уже забрал другой воркер"""
+        with self._lock:
+            if inn in self._inns:
+                return False
+            self._inns.add(inn)
+            return True
+
+
+def setup_driver(worker_id=0, slot=0):
+    """Настройка веб-драйвера для работы на VPS (у каждого воркера свой профиль и порт отладки;
+    slot=1 - профиль и порт запасного браузера воркера)"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
     options = webdriver.ChromeOptions()
+    profile = f'worker_{worker_id}' + ('_standby' if slot else '')
 
     # Основные аргументы
     options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--remote-debugging-port=9222")
+    options.add_argument(f"--remote-debugging-port={DEBUG_PORT_BASE + worker_id + slot * STANDBY_PORT_OFFSET}")
+    options.add_argument(f"--user-data-dir={os.path.abspath(os.path.join(PROFILES_DIR, profile))}")
     options.add_argument("--disable-gpu")
 
     # Укажите явный путь к Chrome
-    options.binary_location = '/usr/bin/google-chrome'
+    options.binary_location = CHROME_BINARY
 
     # Дополнительные настройки
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    options.add_argument(f"user-agent={USER_AGENT}")
     options.add_argument("--window-size=1920,1080")
 
+    # Не ждем и не грузим то, что парсеру не нужно
+    options.page_load_strategy = PAGE_LOAD_STRATEGY
+    if 'images' in BLOCK_RESOURCES:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
     try:
         # Используйте явный путь к ChromeDriver
-        service = Service('/usr/local/bin/chromedriver')
-        driver = webdriver.Chrome(service=service, options=options)
+        service = Service(CHROMEDRIVER_PATH)
+        with METRICS.timed('driver_startup'):
+            driver = webdriver.Chrome(service=service, options=options)
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
 
         driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
             "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
         })
 
+        blocked_urls = [pattern for category in BLOCK_RESOURCES for pattern in BLOCKED_URL_PATTERNS[category]]
+        if blocked_urls:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
+
         return driver
     except Exception as e:
         logger.error(f"Ошибка при инициализации драйвера: {str(e)}")
         raise
 
 
+def record_page_transfer(driver, page):
+    """Учет байт, переданных при загрузке текущей страницы (документ и ресурсы, по Resource Timing API)"""
+    try:
+        transferred = driver.execute_script(
+            "return performance.getEntries().reduce((total, e) => total + (e.transferSize || 0), 0)")
+    except Exception as e:
+        logger.debug(f"Не удалось получить объем загрузки страницы: {str(e)}")
+        return
+    if transferred:
+        METRICS.inc('transfer_bytes', transferred, page=page)
+        METRICS.inc('transfer_pages', page=page)
+
+
+def session_dead(error):
+    """Ошибка означает, что сессия браузера потеряна (а не просто не нашелся элемент или истек таймаут)"""
+    from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException, WebDriverException
+    from urllib3.exceptions import HTTPError
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException)):
+        return True
+    # Упавший chromedriver: selenium пробрасывает ошибку urllib3 (MaxRetryError, ProtocolError) как есть
+    if not isinstance(error, (WebDriverException, ConnectionError, HTTPError)):
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in DEAD_SESSION_MARKERS)
+
+
+class FetchFailure(Exception):
+    """Сбой загрузки страницы известного типа (kind - ключ RETRY_BACKOFF)"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def classify_failure(error):
+    """Тип сбоя для политики повторов: 'driver', 'timeout', 'no_inn', 'captcha', 'filter' или 'error'"""
+    from selenium.common.exceptions import TimeoutException
+    if isinstance(error, FetchFailure):
+        return error.kind
+    if session_dead(error):
+        return 'driver'
+    if isinstance(error, (TimeoutException, TimeoutError)):
+        return 'timeout'
+    return 'error'
+
+
+def backoff_delay(kind, attempt):
+    """Задержка перед повтором: экспоненциальный рост от базы типа сбоя, половина - случайный разброс"""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF[kind] * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def with_retries(action, what):
+    """action(номер попытки) с повторами по RETRY_BACKOFF, не больше MAX_RETRIES; последняя ошибка пробрасывается"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return action(attempt)
+        except Exception as e:
+            kind = classify_failure(e)
+            if attempt == MAX_RETRIES or kind not in RETRY_BACKOFF:
+                raise
+            delay = backoff_delay(kind, attempt)
+            logger.warning(f"{what}: сбой {kind} ({str(e).strip()[:200]}), "
+                           f"повтор {attempt + 1}/{MAX_RETRIES} через {delay:.1f} с")
+            METRICS.inc('retries', kind=kind)
+            time.sleep(delay)
+
+
+def process_tree_rss(pid):
+    """Суммарная память (RSS, байт) процесса и всех его потомков по /proc; None, если /proc недоступен"""
+    children = {}
+    rss_pages = {}
+    try:
+        entries = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы, поля считаем после него
+        fields = stat[stat.rindex(')') + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss_pages[int(entry)] = int(fields[21])
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss_pages.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total * os.sysconf('SC_PAGE_SIZE')
+
+
+class DriverManager:
+    """Браузер воркера с заменой: после DRIVER_RECYCLE_PAGES загрузок, при росте памяти, замедлении
+    загрузок и потере сессии. Обращения к драйверу передаются текущему браузеру, так что менеджер
+    подставляется везде вместо driver; фильтры по датам после замены применяются заново перед
+    следующей страницей выдачи. Chrome запускается при первом обращении, а не при создании менеджера."""
+
+    def __init__(self, worker_id=0):
+        self.worker_id = worker_id
+        self.date_filters = None  # (start_date, end_date) последнего успешного apply_date_filters
+        self._filters_stale = False  # Браузер заменен после применения фильтров, в его сессии их нет
+        self.filtered_window = None  # Окно, первая страница выдачи которого открыта сейчас (сбрасывает переход)
+        self._slot = 0
+        self._driver = None
+        self._standby = None
+        self._standby_thread = None
+        self._pages = 0
+        self._latencies = deque(maxlen=DRIVER_LATENCY_WINDOW)
+
+    @property
+    def date_filters(self):
+        return self._date_filters
+
+    @date_filters.setter
+    def date_filters(self, value):
+        # apply_date_filters применяет фильтры в текущем браузере
+        self._date_filters = value
+        self._filters_stale = False
+
+    @property
+    def started(self):
+        """Браузер уже запущен (обращение к драйверу до запуска запускает Chrome)"""
+        return self._driver is not None
+
+    def _current(self):
+        """Текущий браузер (запускается при первом обращении вместе с запасным)"""
+        if self._driver is None:
+            logger.info(f"Запуск браузера воркера {self.worker_id}")
+            self._driver = setup_driver(self.worker_id, self._slot)
+            self._start_standby()
+        return self._driver
+
+    def _start_standby(self):
+        """Запуск запасного браузера в фоне, в свободном слоте профиля"""
+        if not DRIVER_WARM_STANDBY:
+            return
+        slot = 1 - self._slot
+
+        def start():
+            try:
+                self._standby = setup_driver(self.worker_id, slot)
+            except Exception as e:
+                logger.warning(f"Не удалось запустить запасной браузер воркера {self.worker_id}: {str(e)}")
+
+        self._standby_thread = threading.Thread(target=start, name=f"standby-{self.worker_id}", daemon=True)
+        self._standby_thread.start()
+
+    def _take_standby(self):
+        """Запасной браузер (дожидаемся, если он еще запускается) или новый, если запасного нет"""
+        if self._standby_thread is not None:
+            self._standby_thread.join()
+            self._standby_thread = None
+        driver, self._standby = self._standby, None
+        return driver or setup_driver(self.worker_id, 1 - self._slot)
+
+    def recycle_reason(self):
+        """Причина заменить браузер перед следующей загрузкой или None"""
+        process = getattr(self._driver.service, 'process', None)
+        if process is not None and process.poll() is not None:
+            return 'dead'
+        if DRIVER_RECYCLE_PAGES and self._pages >= DRIVER_RECYCLE_PAGES:
+            return 'pages'
+        if DRIVER_MAX_PAGE_LATENCY and len(self._latencies) == self._latencies.maxlen \
+                and sum(self._latencies) / len(self._latencies) > DRIVER_MAX_PAGE_LATENCY:
+            return 'latency'
+        if DRIVER_MAX_RSS_MB and process is not None and self._pages and self._pages % DRIVER_RSS_CHECK_EVERY == 0:
+            rss = process_tree_rss(process.pid)
+            if rss and rss > DRIVER_MAX_RSS_MB * 1024 * 1024:
+                return 'memory'
+        return None
+
+    def replace(self, reason, restore_filters=True):
+        """Переход на запасной браузер; старый закрывается, вместо него в фоне запускается новый запасной"""
+        logger.info(f"Замена браузера воркера {self.worker_id}: {reason}, загружено страниц: {self._pages}")
+        METRICS.inc('driver_recycles', reason=reason)
+        old_driver = self._driver
+        self._driver = self._take_standby()
+        self._slot = 1 - self._slot
+        self._pages = 0
+        self._latencies.clear()
+        try:
+            old_driver.quit()
+        except Exception as e:
+            logger.debug(f"Ошибка при закрытии старого браузера: {str(e)}")
+        self._start_standby()
+
+        # Выдача листается по адресу ?page=N, фильтры которого хранятся в сессии браузера
+        self._filters_stale = self.date_filters is not None
+        if restore_filters and self._filters_stale:
+            self._restore_filters()
+
+    def _restore_filters(self):
+        """Применение последних фильтров по датам в новом браузере"""
+        from selenium.common.exceptions import WebDriverException
+        get_rate_limiter().acquire()
+        self._driver.get(BASE_URL)
+        if not _apply_date_filters(self._driver, *self.date_filters):
+            raise WebDriverException("Не удалось восстановить фильтры после замены браузера")
+        self._filters_stale = False
+
+    def get(self, url):
+        """driver.get с заменой браузера по порогам и повтором при потерянной сессии"""
+        self._current()
+        self.filtered_window = None
+        # Фильтры нужны только страницам выдачи: страницы компаний и поиска открываются без них
+        listing_page = url.startswith(f"{BASE_URL}?page=")
+        reason = self.recycle_reason()
+        if reason:
+            self.replace(reason, restore_filters=listing_page)
+        elif listing_page and self._filters_stale:
+            # Браузер заменили при загрузке страницы компании - фильтры восстанавливаем сейчас
+            self._restore_filters()
+
+        for attempt in range(2):
+            started = time.perf_counter()
+            try:
+                return self._driver.get(url)
+            except Exception as e:
+                if attempt or not session_dead(e):
+                    raise
+                logger.warning(f"Сессия браузера воркера {self.worker_id} потеряна: {str(e)}")
+                self.replace('dead', restore_filters=listing_page)
+            finally:
+                self._pages += 1
+                self._latencies.append(time.perf_counter() - started)
+
+    def quit(self):
+        """Закрытие текущего и запасного браузеров"""
+        if self._standby_thread is not None:
+            self._standby_thread.join()
+            self._standby_thread = None
+        for driver in (self._driver, self._standby):
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception as e:
+                    logger.debug(f"Ошибка при закрытии браузера: {str(e)}")
+
+    def _call(self, function, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            # Текущий шаг все равно завершится ошибкой, но следующий получит рабочий браузер
+            if session_dead(e):
+                logger.warning(f"Сессия браузера воркера {self.worker_id} потеряна: {str(e)}")
+                self.replace('dead')
+            raise
+
+    def __getattr__(self, name):
+        # Атрибуты самого менеджера еще не заданы (например, при копировании) - не уходим в рекурсию
+        if '_slot' not in self.__dict__:
+            raise AttributeError(name)
+        attribute = self._call(getattr, self._current(), name)
+        if not callable(attribute):
+            return attribute
+        return lambda *args, **kwargs: self._call(attribute, *args, **kwargs)
+
+
+class RateLimiter:
+    """Token bucket: не больше rate запросов в секунду, подряд без ожидания - не больше burst"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Забирает токен и возвращает, сколько секунд ждать его появления"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Токен может уйти в долг: следующий запрос встанет в очередь за текущим
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        import asyncio
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """Общий для всех потоков ограничитель запросов к сайту"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+    return _rate_limiter
+
+
+_http_local = threading.local()
+_http_cookies = None
+_http_cookies_lock = threading.Lock()
+
+
+def get_http_cookies():
+    """Общие для всех потоков cookies HTTP-сессий (CookieJar сам защищен блокировкой)"""
+    global _http_cookies
+    from requests.cookies import RequestsCookieJar
+    with _http_cookies_lock:
+        if _http_cookies is None:
+            _http_cookies = RequestsCookieJar()
+        return _http_cookies
+
+
+def get_http_session():
+    """HTTP-сессия текущего потока: keep-alive, сжатие и пул соединений; cookies общие для всех потоков,
+    поэтому cookies из браузера после капчи видят и загрузчики конвейера"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.cookies = get_http_cookies()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+        _http_local.session = session
+    return session
+
+
+def sync_session_cookies(driver):
+    """Перенос cookies из браузера (например, после решения капчи) в HTTP-сессии всех потоков"""
+    cookies = get_http_cookies()
+    for cookie in driver.get_cookies():
+        cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+
+
+def fetch_html_http(url):
+    """Загрузка страницы компании без браузера; None, если нужен браузер (капча, нет данных, ошибка)"""
+    import requests
+    try:
+        with METRICS.timed('http_get'):
+            response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"HTTP-запрос {url} не удался: {str(e)}")
+        METRICS.inc('errors', kind='http')
+        return None
+
+    if response.status_code != 200:
+        logger.warning(f"HTTP-запрос {url} вернул статус {response.status_code}")
+        return None
+
+    # Без charset в заголовке requests считает страницу latin-1
+    if 'charset' not in response.headers.get('Content-Type', ''):
+        response.encoding = 'utf-8'
+    html = response.text
+
+    # Данные компании рендерятся на сервере; если их нет или показана капча - нужен браузер
+    if 'copy-inn' not in html or 'data-sitekey' in html:
+        METRICS.inc('http_fallback')
+        return None
+
+    return html
+
+
 def solve_recaptcha_v2(driver):
     """Полное решение reCAPTCHA v2 с отладкой"""
+    import requests
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     print("Начинаем решение reCAPTCHA v2...")
     debug_screenshot(driver, "before_solving")
 
@@ -166,14 +899,18 @@ def solve_recaptcha_v2(driver):
         raise Exception("Превышено время ожидания решения (5 минут)")
 
     except Exception as e:
-        debug_screenshot(driver, "captcha_error")
+        debug_failure(driver, "captcha_error")
         print(f"Ошибка при решении капчи: {str(e)}")
         return False
 
 
 def handle_captcha(driver):
     """Полная обработка капчи с улучшенной логикой"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     print("Обнаружена капча, начинаем обработку...")
+    METRICS.inc('captcha')
     debug_screenshot(driver, "captcha_detected")
 
     try:
@@ -197,36 +934,288 @@ def handle_captcha(driver):
         return True
 
     except Exception as e:
-        debug_screenshot(driver, "captcha_handling_error")
+        debug_failure(driver, "captcha_handling_error")
         print(f"Ошибка при обработке капчи: {str(e)}")
         return False
 
 
+_debug_ring = deque(maxlen=DEBUG_RING_SIZE)
+_debug_queue = queue.Queue()
+_debug_writer = None
+_debug_writer_lock = threading.Lock()
+
+
+def _debug_write_loop():
+    """Фоновая запись отладочных файлов, чтобы парсинг не ждал диск"""
+    while True:
+        path, content = _debug_queue.get()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        except Exception as e:
+            logger.error(f"Ошибка записи отладочного файла {path}: {str(e)}")
+        finally:
+            _debug_queue.task_done()
+
+
+def _debug_save(path, content):
+    """Передача файла фоновому потоку записи (поток запускается при первом обращении)"""
+    global _debug_writer
+    with _debug_writer_lock:
+        if _debug_writer is None:
+            _debug_writer = threading.Thread(target=_debug_write_loop, name='debug-writer', daemon=True)
+            _debug_writer.start()
+    _debug_queue.put((path, content))
+
+
+def debug_flush():
+    """Дождаться записи всех отладочных файлов"""
+    if _debug_writer is not None:
+        _debug_queue.join()
+
+
+def debug_remember(name, html):
+    """Запоминаем исходник страницы в кольцевом буфере (без копирования и записи на диск)"""
+    if DEBUG_MODE != 'off':
+        _debug_ring.append((time.time(), name, 'html', html))
+
+
 def debug_screenshot(driver, name):
-    """Сохранение скриншота для отладки"""
-    if not os.path.exists('debug'):
-        os.makedirs('debug')
-    driver.save_screenshot(f'debug/{name}.png')
+    """Скриншот обычного шага для отладки: только в режимах 'all' и 'sampled' (с вероятностью DEBUG_SAMPLE_RATE)"""
+    if DEBUG_MODE == 'all' or (DEBUG_MODE == 'sampled' and random.random() < DEBUG_SAMPLE_RATE):
+        png = driver.get_screenshot_as_png()
+        _debug_ring.append((time.time(), name, 'png', png))
+        _debug_save(os.path.join(DEBUG_DIR, f"{name}.png"), png)
+
+
+def debug_failure(driver, name):
+    """При ошибке: скриншот текущего состояния и сброс на диск последних страниц из кольцевого буфера"""
+    if DEBUG_MODE == 'off':
+        return
+
+    folder = os.path.join(DEBUG_DIR, 'failures', f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{name}")
+    # Ошибка без браузера (загрузка по HTTP, разбор) - ради скриншота Chrome не запускаем
+    if getattr(driver, 'started', True):
+        try:
+            _debug_save(os.path.join(folder, 'failure.png'), driver.get_screenshot_as_png())
+        except Exception as e:
+            # Драйвер мог упасть вместе со страницей - сохраняем хотя бы буфер
+            logger.error(f"Не удалось сделать скриншот ошибки {name}: {str(e)}")
+
+    for i, (captured_at, entry_name, kind, content) in enumerate(list(_debug_ring), 1):
+        if kind == 'html':
+            content = content.encode('utf-8')
+        _debug_save(os.path.join(folder, f"{i:02d}_{entry_name}.{kind}"), content)
+
+
+_cache_writes = 0
+
+
+def cache_key(url):
+    """Ключ страницы в кэше - хэш ее URL"""
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def _cache_entries(key):
+    """Сохраненные версии страницы: список (время загрузки, путь), новые первыми"""
+    folder = os.path.join(HTML_CACHE_DIR, key[:2])
+    if not os.path.isdir(folder):
+        return []
+
+    entries = []
+    for name in os.listdir(folder):
+        if name.startswith(f"{key}-") and name.endswith('.html.gz'):
+            fetched_at = int(name[len(key) + 1:-len('.html.gz')])
+            entries.append((fetched_at, os.path.join(folder, name)))
+    return sorted(entries, reverse=True)
+
+
+def cache_get(url, ttl=None):
+    """HTML страницы из кэша или None, если ее нет или она старше ttl секунд
+    (по умолчанию HTML_CACHE_TTL, float('inf') - любой возраст)"""
+    ttl = HTML_CACHE_TTL if ttl is None else ttl
+    entries = _cache_entries(cache_key(url))
+    if not entries:
+        METRICS.inc('cache', result='miss')
+        return None
+
+    fetched_at, path = entries[0]
+    if time.time() - fetched_at > ttl:
+        METRICS.inc('cache', result='expired')
+        return None
+
+    METRICS.inc('cache', result='hit')
+
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Ошибка чтения кэша {path}: {str(e)}")
+        return None
+
+
+def cache_put(url, html):
+    """Сохранение HTML страницы в кэш (сжатый файл <хэш URL>-<время загрузки>.html.gz)"""
+    global _cache_writes
+
+    key = cache_key(url)
+    folder = os.path.join(HTML_CACHE_DIR, key[:2])
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{key}-{int(time.time())}.html.gz")
+
+    try:
+        # Пишем во временный файл и переименовываем, чтобы не оставить битую запись при сбое
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+
+        # Старые версии этой страницы больше не нужны
+        for _, old_path in _cache_entries(key)[1:]:
+            os.remove(old_path)
+    except Exception as e:
+        logger.error(f"Ошибка записи в кэш {path}: {str(e)}")
+        return
+
+    _cache_writes += 1
+    if _cache_writes % HTML_CACHE_EVICT_EVERY == 0:
+        cache_evict()
+
+
+def cache_evict(ttl=None, max_bytes=None):
+    """Очистка кэша: удаляем просроченные страницы, затем самые старые, пока размер больше max_bytes
+    (по умолчанию HTML_CACHE_TTL и HTML_CACHE_MAX_BYTES)"""
+    ttl = HTML_CACHE_TTL if ttl is None else ttl
+    max_bytes = HTML_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(HTML_CACHE_DIR):
+        return
+
+    entries = []
+    now = time.time()
+    removed = 0
+    for folder, _, names in os.walk(HTML_CACHE_DIR):
+        for name in names:
+            if not name.endswith('.html.gz'):
+                continue
+            path = os.path.join(folder, name)
+            fetched_at = int(name[name.rindex('-') + 1:-len('.html.gz')])
+            if now - fetched_at > ttl:
+                os.remove(path)
+                removed += 1
+                continue
+            entries.append((fetched_at, os.path.getsize(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for fetched_at, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        removed += 1
+
+    if removed:
+        logger.info(f"Из кэша удалено {removed} страниц, размер кэша: {total / 1024 ** 2:.1f} МБ")
+
+
+def listing_cache_url(start_date, end_date, page_num):
+    """URL страницы выдачи для кэша: фильтр по датам хранится в сессии, поэтому добавляем его в ключ"""
+    return (f"{BASE_URL}?page={page_num}"
+            f"&reg_date_from={start_date.strftime('%Y-%m-%d')}&reg_date_to={end_date.strftime('%Y-%m-%d')}")
+
+
+def get_latency_logger():
+    """Лог задержек; обработчик файла latency.log подключается при первом обращении"""
+    if not latency_logger.handlers:
+        with _latency_lock:
+            if not latency_logger.handlers:
+                handler = logging.FileHandler('latency.log')
+                handler.setFormatter(logging.Formatter('%(asctime)s\t%(message)s'))
+                latency_logger.addHandler(handler)
+    return latency_logger
+
+
+def wait_for(driver, step, condition, timeout=None, required=True):
+    """Ожидание условия не дольше WAIT_TIMEOUTS[step] с записью реальной длительности в лог задержек"""
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        return WebDriverWait(driver, timeout or WAIT_TIMEOUTS[step], poll_frequency=WAIT_POLL_INTERVAL).until(condition)
+    except TimeoutException:
+        outcome = 'timeout'
+        if required:
+            raise
+        return None
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.observe(f"wait_{step}", elapsed)
+        get_latency_logger().info(f"{step}\t{elapsed:.3f}\t{outcome}")
+
+
+def page_ready(driver):
+    """Условие: документ разобран (картинки и прочие ресурсы не ждем)"""
+    return driver.execute_script("return document.readyState") in ('interactive', 'complete')
+
+
+def listing_ready(driver):
+    """Условие: на странице выдачи есть компании, сообщение о пустой выдаче или капча"""
+    from selenium.webdriver.common.by import By
+    return (driver.find_elements(By.CSS_SELECTOR, 'a.link[href^="/company/"]') or
+            driver.find_elements(By.CSS_SELECTOR, "p.mt-4.text-center") or
+            driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"))
+
+
+def results_replaced(old_result):
+    """Условие: старая выдача исчезла из DOM и появилась новая (или капча)"""
+    from selenium.common.exceptions import StaleElementReferenceException
+    from selenium.webdriver.common.by import By
+
+    def condition(driver):
+        if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
+            return True
+        if old_result is not None:
+            try:
+                old_result.is_enabled()
+                return False
+            except StaleElementReferenceException:
+                pass
+        return page_ready(driver) and listing_ready(driver)
+    return condition
+
+
+def input_value(element, filled):
+    """Условие: поле ввода пустое (filled=False) или заполнено (filled=True)"""
+    return lambda driver: bool(element.get_attribute('value')) == filled
 
 
 def apply_date_filters(driver, start_date, end_date):
+    """Применение фильтров по дате регистрации с замером длительности"""
+    with METRICS.timed('filter_apply'):
+        applied = _apply_date_filters(driver, start_date, end_date)
+    if applied and isinstance(driver, DriverManager):
+        # Браузер, пришедший на замену, восстановит эти фильтры сам; пока нет перехода,
+        # открыта первая страница выдачи окна - ее можно читать без повторного применения фильтров
+        driver.date_filters = (start_date, end_date)
+        driver.filtered_window = (start_date, end_date)
+    return applied
+
+
+def _apply_date_filters(driver, start_date, end_date):
     """Применение фильтров по дате регистрации с улучшенной обработкой"""
+    from selenium.webdriver import Keys
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
     logger.info(f"Применение фильтров: {start_date.strftime('%Y-%m-%d')} - {end_date.strftime('%Y-%m-%d')}")
 
     try:
-        # Ожидаем загрузки страницы
-        WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "button[data-bs-target='#flush-collapse-1']"))
-        )
+        # Ожидаем загрузки страницы и кнопки "Дата регистрации"
+        date_button = wait_for(driver, 'filter_panel', EC.element_to_be_clickable(
+            (By.CSS_SELECTOR, "button[data-bs-target='#flush-collapse-1']")))
 
         # Прокручиваем к верхней части страницы
         driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(1)
-
-        # Находим кнопку "Дата регистрации"
-        date_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-bs-target='#flush-collapse-1']"))
-        )
 
         # Проверяем состояние кнопки (открыта/закрыта)
         is_collapsed = "collapsed" in date_button.get_attribute("class")
@@ -235,12 +1224,9 @@ def apply_date_filters(driver, start_date, end_date):
         if is_collapsed:
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", date_button)
             date_button.click()
-            time.sleep(2)
 
         # Ждем появления полей ввода дат
-        WebDriverWait(driver, 10).until(
-            EC.visibility_of_element_located((By.ID, "reg_date_from"))
-        )
+        wait_for(driver, 'filter_inputs', EC.visibility_of_element_located((By.ID, "reg_date_from")))
 
         # Очищаем поле "От" (3 разных способа на случай если один не сработает)
         date_from = driver.find_element(By.ID, "reg_date_from")
@@ -248,7 +1234,7 @@ def apply_date_filters(driver, start_date, end_date):
         date_from.clear()  # Способ 1: стандартный clear()
         date_from.send_keys(Keys.CONTROL + 'a')  # Способ 2: выделить все
         date_from.send_keys(Keys.DELETE)  # Способ 3: удалить
-        time.sleep(1)
+        wait_for(driver, 'date_input', input_value(date_from, filled=False), required=False)
 
         # Очищаем поле "До" (аналогично)
         date_to = driver.find_element(By.ID, "reg_date_to")
@@ -256,224 +1242,438 @@ def apply_date_filters(driver, start_date, end_date):
         date_to.clear()
         date_to.send_keys(Keys.CONTROL + 'a')
         date_to.send_keys(Keys.DELETE)
-        time.sleep(1)
+        wait_for(driver, 'date_input', input_value(date_to, filled=False), required=False)
 
         # Вводим новые даты
         date_from.send_keys(start_date.strftime("%Y-%m-%d"))
-        time.sleep(1)
+        wait_for(driver, 'date_input', input_value(date_from, filled=True), required=False)
         date_to.send_keys(end_date.strftime("%Y-%m-%d"))
-        time.sleep(1)
+        wait_for(driver, 'date_input', input_value(date_to, filled=True), required=False)
 
         # Прокручиваем к кнопке "Применить"
-        apply_button = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located(
-                (By.XPATH, "//button[contains(@class, 'primary') and contains(., 'Применить')]"))
-        )
+        apply_button = wait_for(driver, 'filter_inputs', EC.presence_of_element_located(
+            (By.XPATH, "//button[contains(@class, 'primary') and contains(., 'Применить')]")))
         driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", apply_button)
-        time.sleep(1)
+        wait_for(driver, 'filter_inputs', EC.element_to_be_clickable(apply_button))
 
-        # Кликаем кнопку "Применить"
-        # После клика на кнопку "Применить"
+        # Запоминаем текущую выдачу, чтобы дождаться ее замены
+        old_results = driver.find_elements(By.CSS_SELECTOR, 'a.link[href^="/company/"]')
+
+        # Кликаем кнопку "Применить" и ждем новую выдачу (или капчу)
         apply_button.click()
-        time.sleep(6)
+        wait_for(driver, 'filter_results', results_replaced(old_results[0] if old_results else None))
 
         # Проверяем капчу после применения фильтров
         if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
             if not handle_captcha(driver):
                 return False
-        # Ждем загрузки результатов
 
         return True
 
     except Exception as e:
         logger.error(f"Ошибка при применении фильтров: {str(e)}")
-        debug_screenshot(driver, "filter_error")
+        METRICS.inc('errors', kind='filter')
+        debug_failure(driver, "filter_error")
         return False
 
 
-def get_all_company_links(driver):
-    """Собираем ссылки на компании с учетом уже примененных фильтров"""
-    all_links = []
-    page_num = 1
-    max_pages = 999  # Максимальное количество страниц
-    processed_pages = set()
+def parse_listing_page(html):
+    """Разбор страницы выдачи: (ссылки на компании, признак пустой выдачи)"""
+    soup = make_soup(html)
 
-    while page_num <= max_pages:
-        logger.info(f"Обработка страницы {page_num}")
+    # Проверяем наличие сообщения о том, что не найдено ни одного юридического лица
+    no_results_message = soup.select_one("p.mt-4.text-center")
+    if no_results_message and "Не найдено ни одного юридического лица" in no_results_message.text:
+        return [], True
 
-        try:
-            # Применяем фильтры для текущей страницы
-            if page_num > 1:
-                # В случае, если не первая страница, переходим на нужную страницу
-                driver.get(f"{BASE_URL}?page={page_num}")
-                time.sleep(2)
+    # Собираем ссылки на компании
+    return [f"{SITE_URL}{a['href']}" for a in soup.select('a.link[href^="/company/"]')], False
 
-                # Проверяем наличие капчи
-                if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
-                    if not handle_captcha(driver):
-                        logger.error("Не удалось решить капчу при переходе на страницу")
-                        break
 
-            # Прокручиваем страницу до конца, чтобы кнопка "Далее" стала видимой
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
+def read_listing_page(driver, page_num, cache_url=None, navigate=True):
+    """HTML страницы выдачи из кэша или браузера (navigate=False - страница уже открыта);
+    нерешенная капча - FetchFailure"""
+    from selenium.webdriver.common.by import By
+    html = cache_get(cache_url, HTML_CACHE_LISTING_TTL) if cache_url else None
+    if html is not None:
+        logger.info(f"Страница {page_num} взята из кэша")
+        return html
 
-            # Проверяем наличие капчи после прокрутки
-            if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
-                if not handle_captcha(driver):
-                    logger.error("Не удалось решить капчу после прокрутки")
-                    break
+    if navigate:
+        # Переходим на нужную страницу (фильтры хранятся в сессии браузера)
+        get_rate_limiter().acquire()
+        driver.get(f"{BASE_URL}?page={page_num}")
+        wait_for(driver, 'listing_page', lambda d: page_ready(d) and listing_ready(d))
 
-            # Собираем все ссылки на компании на текущей странице
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # Проверяем наличие капчи
+        if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
+            if not handle_captcha(driver):
+                raise FetchFailure('captcha', "Не удалось решить капчу при переходе на страницу")
+
+    # Прокручиваем страницу до конца, чтобы кнопка "Далее" стала видимой
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    wait_for(driver, 'scroll', page_ready, required=False)
+
+    # Проверяем наличие капчи после прокрутки
+    if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
+        if not handle_captcha(driver):
+            raise FetchFailure('captcha', "Не удалось решить капчу после прокрутки")
+
+    html = driver.page_source
+    record_page_transfer(driver, 'listing')
+    if cache_url:
+        cache_put(cache_url, html)
+    return html
+
+
+def iter_company_links(driver, start_date=None, end_date=None, start_page=1, on_page=None, status=None):
+    """Выдаем новые ссылки на компании по мере чтения страниц выдачи (страницы берутся из кэша, если есть)
+
+    Между страницами драйвер можно использовать для других задач: следующая страница открывается по URL.
+    on_page(номер страницы, новые ссылки) вызывается после чтения каждой страницы.
+    Страница, не загруженная и после повторов, откладывается в dead letters вместе с остатком окна,
+    а в словарь status пишется status['complete'] = False (выдача пролистана до конца - True).
+    """
+    if status is not None:
+        status['complete'] = True
+    seen_links = set()
+    page_num = start_page
+    max_pages = MAX_LISTING_PAGES  # Максимальное количество страниц
 
-            # Проверяем наличие сообщения о том, что не найдено ни одного юридического лица
-            no_results_message = soup.select_one("p.mt-4.text-center")
-            if no_results_message and "Не найдено ни одного юридического лица" in no_results_message.text:
-                logger.info("Не найдено ни одного юридического лица на последней странице.")
-                break
+    while page_num <= max_pages:
+        logger.info(f"Обработка страницы {page_num}")
+        page_started = time.perf_counter()
+        cache_url = listing_cache_url(start_date, end_date, page_num) if start_date and end_date else None
 
-            # Собираем ссылки на компании
-            current_links = [f"https://checko.ru{a['href']}" for a in soup.select('a.link[href^="/company/"]')]
+        try:
+            # Первую страницу фильтры уже открыли; при повторе любую страницу открываем заново по адресу
+            html = with_retries(
+                lambda attempt: read_listing_page(driver, page_num, cache_url, navigate=page_num > 1 or attempt > 0),
+                f"Страница выдачи {page_num}")
+            debug_remember(f"listing_page_{page_num}", html)
 
-            # Проверяем новые ссылки и добавляем их
-            new_links = [link for link in current_links if link not in all_links]
-            all_links.extend(new_links)
-            logger.info(f"Добавлено {len(new_links)} новых ссылок (Всего: {len(all_links)})")
+            # Собираем все ссылки на компании на текущей странице
+            current_links, no_results = parse_listing_page(html)
+            if no_results:
+                logger.info("Не найдено ни одного юридического лица на последней странице.")
+                break
 
-            # Увеличиваем номер страницы для следующей итерации
-            page_num += 1
+            # Проверяем новые ссылки
+            new_links = []
+            for link in current_links:
+                if link not in seen_links:
+                    seen_links.add(link)
+                    new_links.append(link)
+            logger.info(f"Добавлено {len(new_links)} новых ссылок (Всего: {len(seen_links)})")
 
         except Exception as e:
             logger.error(f"Ошибка на странице {page_num}: {str(e)}")
-            debug_screenshot(driver, f"page_{page_num}_error")
+            METRICS.inc('errors', kind='listing_page')
+            debug_failure(driver, f"page_{page_num}_error")
+            if cache_url:
+                # Повтор отложенных продолжит окно с этой страницы
+                dead_letter_add('listing', cache_url, e, start_date.strftime("%B %Y").lower(),
+                                start_date, end_date, page_num)
+            if status is not None:
+                status['complete'] = False
             break
 
-    logger.info(f"Сбор завершен. Всего ссылок: {len(all_links)}")
-    return all_links
+        METRICS.observe('listing_page', time.perf_counter() - page_started)
+        if on_page:
+            on_page(page_num, new_links)
 
+        # Отдаем ссылки сразу, не дожидаясь остальных страниц
+        yield from new_links
 
-def get_person_info(soup, label):
-    """Универсальная функция для поиска информации о директоре и учредителе"""
-    try:
-        # Определяем, что ищем (директора или учредителя)
-        is_director = 'директор' in label.lower()
-
-        # Поиск директора
-        if is_director:
-            director = None
-            director_inn = None  # Добавляем переменную для ИНН директора
-
-            # Находим секцию с директором
-            director_section = soup.find('div', class_='fw-700', string=lambda t: t and 'директор' in t.lower())
-            if not director_section:
-                director_section = soup.find('strong', class_='fw-700', string=lambda t: t and 'директор' in t.lower())
-
-            if director_section:
-                # Ищем ссылку на имя директора
-                director_tag = director_section.find_next('a', class_='link')
-                if director_tag:
-                    director = director_tag.get_text(strip=True)
-
-                    # Находим ИНН рядом с директором
-                    director_inn_tag = director_section.find_next('span', {'class': 'copy'})
-                    if director_inn_tag:
-                        director_inn = director_inn_tag.get_text(strip=True)
+        # Увеличиваем номер страницы для следующей итерации
+        page_num += 1
+    else:
+        logger.warning(f"Достигнут предел в {max_pages} страниц, часть компаний окна может быть не собрана")
+
+    logger.info(f"Сбор завершен. Всего ссылок: {len(seen_links)}")
+
+
+def get_all_company_links(driver, start_date=None, end_date=None):
+    """Собираем все ссылки на компании с учетом уже примененных фильтров"""
+    return list(iter_company_links(driver, start_date, end_date))
+
+
+def get_window_size(driver):
+    """Размер выдачи после применения фильтров: (число компаний или None, число страниц или None)"""
+    soup = make_soup(driver.page_source)
+
+    no_results_message = soup.select_one("p.mt-4.text-center")
+    if no_results_message and "Не найдено ни одного юридического лица" in no_results_message.text:
+        return 0, 0
+
+    results = None
+    match = re.search(r'Найден[оаы]?\s+(\d[\d\s]*)', soup.get_text(' '))
+    if match:
+        results = int(re.sub(r'\D', '', match.group(1)))
+
+    # Число страниц - по самому большому номеру в ссылках пагинации
+    page_numbers = [int(m.group(1)) for a in soup.select('a[href*="page="]')
+                    if (m := re.search(r'page=(\d+)', a['href']))]
+    pages = max(page_numbers) if page_numbers else None
+
+    return results, pages
+
+
+def split_window(start_date, end_date):
+    """Деление окна: длиннее недели - на недели, иначе - на дни"""
+    step = timedelta(days=7) if (end_date - start_date).days >= 7 else timedelta(days=1)
+    windows = []
+    current = start_date
+    while current <= end_date:
+        windows.append((current, min(current + step - timedelta(days=1), end_date)))
+        current += step
+    return windows
+
+
+def shard_tree(start_date, end_date):
+    """Все окна, которые может дать деление окна в plan_date_shards: само окно, недели, дни"""
+    yield start_date, end_date
+    if start_date < end_date:
+        for window_start, window_end in split_window(start_date, end_date):
+            yield from shard_tree(window_start, window_end)
+
+
+def plan_date_shards(driver, start_date, end_date):
+    """Разбиение окна дат на части, в каждой из которых выдача не больше SHARD_MAX_RESULTS / SHARD_MAX_PAGES"""
+    if window_done(start_date, end_date):
+        return [(start_date, end_date)]
+
+    shards = []
+    pending = [(start_date, end_date)]
+    while pending:
+        shard_start, shard_end = pending.pop(0)
+        get_rate_limiter().acquire()
+        driver.get(BASE_URL)
+        if not apply_date_filters(driver, shard_start, shard_end):
+            # Ошибку фильтра обработает сам проход по окну
+            shards.append((shard_start, shard_end))
+            continue
+
+        results, pages = get_window_size(driver)
+        too_big = (results or 0) > SHARD_MAX_RESULTS or (pages or 0) > SHARD_MAX_PAGES
+        logger.info(f"Окно {window_key(shard_start, shard_end)}: компаний {results}, страниц {pages}")
+
+        if not too_big:
+            shards.append((shard_start, shard_end))
+        elif shard_start == shard_end:
+            # Дальше делить некуда - не теряем молча то, что не поместится в выдачу
+            logger.warning(f"За {shard_start.strftime('%Y-%m-%d')} выдача больше порога "
+                           f"(компаний {results}, страниц {pages}), часть компаний может быть недоступна")
+            shards.append((shard_start, shard_end))
+        else:
+            pending[:0] = split_window(shard_start, shard_end)
+
+    if len(shards) > 1:
+        logger.info(f"Окно {window_key(start_date, end_date)} разбито на {len(shards)} частей")
+    return shards
+
+
+class PageIndex:
+    """Индекс страницы за один обход дерева: элементы по тегу, id, классу и собственному тексту (.string)"""
+
+    def __init__(self, soup):
+        self.by_tag = {}
+        self.by_id = {}
+        self.by_class = {}
+        self.by_string = {}
+        self._position = {}
+        for i, element in enumerate(soup.find_all(True)):
+            self._position[id(element)] = i
+            self.by_tag.setdefault(element.name, []).append(element)
+
+            element_id = element.get('id')
+            if element_id:
+                self.by_id.setdefault(element_id, []).append(element)
+
+            # Как class_ в BeautifulSoup: совпадение с отдельным классом или со всем атрибутом
+            classes = element.get('class') or []
+            for key in {*classes, ' '.join(classes)} if classes else ():
+                self.by_class.setdefault((element.name, key), []).append(element)
+
+            string = element.string
+            if string is not None:
+                self.by_string.setdefault((element.name, str(string)), []).append(element)
+
+    def position(self, element):
+        return self._position[id(element)]
+
+    def find(self, name, id=None, class_=None, string=None, test=None):
+        """Первый элемент по тегу и условиям (аналог soup.find) без обхода дерева"""
+        if id is not None:
+            candidates = self.by_id.get(id, ())
+        elif string is not None:
+            candidates = self.by_string.get((name, string), ())
+        elif class_ is not None:
+            candidates = self.by_class.get((name, class_), ())
+        else:
+            candidates = self.by_tag.get(name, ())
 
-                else:
-                    # Альтернативный вариант поиска, если структура отличается
-                    parent_div = director_section.find_parent('div', class_='mb-3')
-                    if parent_div:
-                        director_tag = parent_div.find('a', class_='link')
-                        if director_tag:
-                            director = director_tag.get_text(strip=True)
-                            director_inn_tag = parent_div.find('span', {'class': 'copy'})
-                            if director_inn_tag:
-                                director_inn = director_inn_tag.get_text(strip=True)
+        for element in candidates:
+            if element.name != name or (class_ is not None and not has_class(element, class_)):
+                continue
+            if test is None or test(element):
+                return element
+        return None
 
-            return director, director_inn  # Возвращаем два значения: директор и ИНН
+    def find_next(self, element, name, class_=None):
+        """Следующий за element в порядке документа элемент с тегом name (аналог find_next)"""
+        candidates = self.by_class.get((name, class_), []) if class_ else self.by_tag.get(name, [])
+        start = bisect.bisect_right(candidates, self.position(element), key=self.position)
+        return candidates[start] if start < len(candidates) else None
 
-        # Поиск учредителя
-        else:
-            founder = None
-            founder_inn = None
 
-            # Попытка найти учредителя в секции с ID 'founders'
-            founder_section = soup.find('section', id='founders')
+def has_class(element, class_):
+    """Проверка класса как в BeautifulSoup: отдельный класс или весь атрибут целиком"""
+    classes = element.get('class') or []
+    return class_ in classes or ' '.join(classes) == class_
 
-            if founder_section:
-                # Находим таблицу с учредителями
-                founder_table = founder_section.find('table', class_='table table-md')
-
-                if founder_table:
-                    # Находим все строки в таблицы
-                    rows = founder_table.find_all('tr')
-
-                    if rows:
-                        # Извлекаем первого учредителя (первую строку таблицы, пропуская заголовок)
-                        first_row = rows[1]  # Пропускаем заголовок таблицы
-                        columns = first_row.find_all('td')  # Получаем все столбцы в строке
-
-                        if len(columns) >= 2:
-                            # Извлекаем Ф. И. О. учредителя
-                            founder_tag = columns[1].find('a')
-                            if founder_tag:
-                                founder = founder_tag.get_text(strip=True)
-
-                                # Проверка на "Показать на карте"
-                                if "Показать на карте" in founder:
-                                    return '', ''  # Возвращаем пустые строки, если нашли "Показать на карте"
-
-                                # Извлекаем ИНН учредителя
-                                inn_div = columns[1].find_next('div')
-                                if inn_div and "ИНН" in inn_div.text:
-                                    founder_inn = inn_div.text.split()[
-                                        -1]  # Получаем последний элемент, который будет ИНН
-                            else:
-                                logger.error("Не удалось найти имя учредителя в таблице.")
+
+def text_strip(element):
+    return element.get_text(strip=True)
+
+
+def resolve_director(index):
+    """Директор и его ИНН: подпись с "директор" (div или strong), затем ближайшая ссылка и span.copy"""
+    try:
+        director = None
+        director_inn = None
+
+        def is_director(tag):
+            return tag.string is not None and 'директор' in tag.string.lower()
+
+        # Находим секцию с директором
+        director_section = (index.find('div', class_='fw-700', test=is_director) or
+                            index.find('strong', class_='fw-700', test=is_director))
+
+        if director_section:
+            # Ищем ссылку на имя директора
+            director_tag = index.find_next(director_section, 'a', class_='link')
+            if director_tag:
+                director = director_tag.get_text(strip=True)
+
+                # Находим ИНН рядом с директором
+                director_inn_tag = index.find_next(director_section, 'span', class_='copy')
+                if director_inn_tag:
+                    director_inn = director_inn_tag.get_text(strip=True)
+
+            else:
+                # Альтернативный вариант поиска, если структура отличается
+                parent_div = director_section.find_parent('div', class_='mb-3')
+                if parent_div:
+                    director_tag = parent_div.find('a', class_='link')
+                    if director_tag:
+                        director = director_tag.get_text(strip=True)
+                        director_inn_tag = parent_div.find('span', {'class': 'copy'})
+                        if director_inn_tag:
+                            director_inn = director_inn_tag.get_text(strip=True)
+
+        return director, director_inn
+
+    except Exception as e:
+        logger.error(f"Ошибка при поиске директора: {str(e)}")
+        return '', ''
+
+
+def resolve_founder(index):
+    """Учредитель и его ИНН: первая строка таблицы в секции founders, иначе подпись "Учредитель" """
+    try:
+        founder = None
+        founder_inn = None
+
+        # Попытка найти учредителя в секции с ID 'founders'
+        founder_section = index.find('section', id='founders')
+
+        if founder_section:
+            # Находим таблицу с учредителями
+            founder_table = founder_section.find('table', class_='table table-md')
+
+            if founder_table:
+                # Находим все строки в таблицы
+                rows = founder_table.find_all('tr')
+
+                if rows:
+                    # Извлекаем первого учредителя (первую строку таблицы, пропуская заголовок)
+                    first_row = rows[1]  # Пропускаем заголовок таблицы
+                    columns = first_row.find_all('td')  # Получаем все столбцы в строке
+
+                    if len(columns) >= 2:
+                        # Извлекаем Ф. И. О. учредителя
+                        founder_tag = columns[1].find('a')
+                        if founder_tag:
+                            founder = founder_tag.get_text(strip=True)
+
+                            # Проверка на "Показать на карте"
+                            if "Показать на карте" in founder:
+                                return '', ''  # Возвращаем пустые строки, если нашли "Показать на карте"
+
+                            # Извлекаем ИНН учредителя
+                            inn_div = index.find_next(columns[1], 'div')
+                            if inn_div and "ИНН" in inn_div.text:
+                                founder_inn = inn_div.text.split()[
+                                    -1]  # Получаем последний элемент, который будет ИНН
                         else:
-                            logger.error("Не удалось найти достаточное количество столбцов для учредителя.")
+                            logger.error("Не удалось найти имя учредителя в таблице.")
                     else:
-                        logger.error("В таблице учредителей нет строк.")
+                        logger.error("Не удалось найти достаточное количество столбцов для учредителя.")
                 else:
-                    logger.error("Таблица учредителей не найдена в секции.")
-
-            # Если учредитель не найден в секции, ищем его через стандартный поиск
-            if not founder:
-                # Стандартный способ поиска учредителя (как было раньше)
-                founder_section = soup.find('strong', class_='fw-700', string='Учредитель')
-                if not founder_section:
-                    founder_section = soup.find('div', class_='fw-700', string='Учредитель')
-
-                if founder_section:
-                    # Ищем ссылку на учредителя рядом с заголовком
-                    founder_tag = founder_section.find_next('a', class_='link')
-                    if founder_tag:
-                        founder = founder_tag.get_text(strip=True)
-                    else:
-                        # Если нет ссылки, проверяем структуру как в вашем примере
-                        parent_div = founder_section.find_parent('div', class_='mb-3')
-                        if parent_div:
-                            # Проверяем, есть ли вложенные div (может быть адрес)
-                            address_divs = parent_div.find_all('div', recursive=False)
-                            if len(address_divs) > 0 and 'Субъект РФ' not in address_divs[0].get_text():
-                                # Если это не адрес, то берем текст после заголовка
-                                founder = parent_div.get_text(strip=True).replace('Учредитель', '').strip()
-                            elif len(address_divs) > 0:
-                                # Если это адрес, пропускаем
-                                founder = None
-
-            return founder, founder_inn  # Возвращаем Ф. И. О. и ИНН учредителя
+                    logger.error("В таблице учредителей нет строк.")
+            else:
+                logger.error("Таблица учредителей не найдена в секции.")
+
+        # Если учредитель не найден в секции, ищем его через стандартный поиск
+        if not founder:
+            # Стандартный способ поиска учредителя (как было раньше)
+            founder_section = (index.find('strong', class_='fw-700', string='Учредитель') or
+                               index.find('div', class_='fw-700', string='Учредитель'))
+
+            if founder_section:
+                # Ищем ссылку на учредителя рядом с заголовком
+                founder_tag = index.find_next(founder_section, 'a', class_='link')
+                if founder_tag:
+                    founder = founder_tag.get_text(strip=True)
+                else:
+                    # Если нет ссылки, проверяем структуру как в вашем примере
+                    parent_div = founder_section.find_parent('div', class_='mb-3')
+                    if parent_div:
+                        # Проверяем, есть ли вложенные div (может быть адрес)
+                        address_divs = parent_div.find_all('div', recursive=False)
+                        if len(address_divs) > 0 and 'Субъект РФ' not in address_divs[0].get_text():
+                            # Если это не адрес, то берем текст после заголовка
+                            founder = parent_div.get_text(strip=True).replace('Учредитель', '').strip()
+                        elif len(address_divs) > 0:
+                            # Если это адрес, пропускаем
+                            founder = None
+
+        return founder, founder_inn  # Возвращаем Ф. И. О. и ИНН учредителя
 
     except Exception as e:
-        logger.error(f"Ошибка при поиске {label}: {str(e)}")
-        return '', ''  # Возвращаем два значения пустых строк для директора и ИНН
+        logger.error(f"Ошибка при поиске учредителя: {str(e)}")
+        return '', ''
 
 
-def get_first_okved(soup):
-    """Функция для получения первого вида ОКВЭД"""
+def resolve_phones(index):
+    """Телефоны из блоков col-12 col-lg-4 с подписью "Телефон", без повторов"""
+    phones = []
+    for div in index.by_class.get(('div', 'col-12 col-lg-4'), ()):
+        if 'Телефон' in div.get_text():
+            phone_links = div.find_all('a', href=lambda x: x and x.startswith('tel:'))
+            for link in phone_links:
+                phone = link.get_text(strip=True)
+                if phone and phone not in phones:
+                    phones.append(phone)
+
+    return ', '.join(phones) if phones else None
+
+
+def resolve_okved(index):
+    """Первый вид деятельности (код, описание); None, если секции activity нет"""
     try:
-        x_section = soup.find('section', id='activity')
+        x_section = index.find('section', id='activity')
         if x_section:
             print('Секция найдена')
             # Находим таблицу с видами деятельности
@@ -502,6 +1702,64 @@ def get_first_okved(soup):
         return None, None
 
 
+def get_person_info(soup, label):
+    """Универсальная функция для поиска информации о директоре и учредителе"""
+    index = PageIndex(soup)
+    return resolve_director(index) if 'директор' in label.lower() else resolve_founder(index)
+
+
+def get_first_okved(soup):
+    """Функция для получения первого вида ОКВЭД"""
+    return resolve_okved(PageIndex(soup))
+
+
+# Схема полей записи компании. Каждое поле: name (имя этапа в метриках), fields (какие поля заполняет) и
+# либо resolve(index), либо декларативный поиск: find - (тег, условия PageIndex.find), next - тег следующего
+# элемента со значением, value - получение значения из элемента. Поиск идет по индексу страницы,
+# так что новое поле не добавляет обхода всего дерева
+COMPANY_SCHEMA = (
+    {'name': 'inn', 'fields': ('inn',), 'find': ('strong', {'id': 'copy-inn'}), 'value': text_strip},
+    {'name': 'date', 'fields': ('date',), 'find': ('div', {'string': 'Дата регистрации'}), 'next': 'div',
+     'value': text_strip},
+    {'name': 'director', 'fields': ('director', 'director_inn'), 'resolve': resolve_director},
+    {'name': 'founder', 'fields': ('founder', 'founder_inn'), 'resolve': resolve_founder},
+    {'name': 'phones', 'fields': ('phone',), 'resolve': resolve_phones},
+    {'name': 'email', 'fields': ('email',),
+     'find': ('a', {'test': lambda tag: (tag.get('href') or '').startswith('mailto:')}), 'value': text_strip},
+    {'name': 'okved', 'fields': ('okved_code', 'okved_description'), 'resolve': resolve_okved},
+    {'name': 'address', 'fields': ('legal_address',), 'find': ('span', {'id': 'copy-address'}), 'value': text_strip},
+    {'name': 'capital', 'fields': ('charter_capital',), 'find': ('div', {'string': 'Уставный капитал'}),
+     'next': 'div', 'value': text_strip},
+)
+
+
+def compile_field(spec):
+    """Функция index -> кортеж значений полей по описанию из схемы"""
+    if 'resolve' in spec:
+        resolve = spec['resolve']
+        if len(spec['fields']) == 1:
+            return lambda index: (resolve(index),)
+        return lambda index: tuple(resolve(index))
+
+    name, conditions = spec['find']
+    next_name = spec.get('next')
+    value = spec['value']
+
+    def extract(index):
+        element = index.find(name, **conditions)
+        if element is None:
+            return (None,)
+        if next_name:
+            # Как find_next(...).get_text(): нет следующего элемента - ошибка разбора страницы
+            element = index.find_next(element, next_name)
+        return (value(element),)
+
+    return extract
+
+
+COMPANY_EXTRACTORS = [(spec['name'], spec['fields'], compile_field(spec)) for spec in COMPANY_SCHEMA]
+
+
 def get_founder_inn(soup):
     """Функция для получения ИНН учредителя"""
     try:
@@ -547,247 +1805,1987 @@ def get_founder_inn(soup):
         return None
 
 
-def parse_company_page(driver, url, existing_inns):
-    """Парсинг данных компании с проверкой дубликатов по ИНН"""
-    print(f"\nОбрабатываем компанию: {url}")
+# Повторяет в странице логику COMPANY_SCHEMA (resolve_director, resolve_founder, resolve_okved)
+# (те же поиски по тегам, классам и тексту, что и в BeautifulSoup) и возвращает поля записи
+EXTRACT_COMPANY_JS = r"""
+const all = Array.from(document.getElementsByTagName('*'));
+const position = new Map(all.map((el, i) => [el, i]));
+const tag = el => el.tagName.toLowerCase();
+const any = () => true;
+
+// class_='a b' в BeautifulSoup сравнивает весь атрибут, class_='a' - отдельные классы
+const hasClass = (el, name) => {
+  const classes = (el.getAttribute('class') || '').split(/\s+/).filter(Boolean);
+  return name.includes(' ') ? classes.join(' ') === name : classes.includes(name);
+};
+const hasId = id => el => el.getAttribute('id') === id;
+const hrefStarts = prefix => el => (el.getAttribute('href') || '').startsWith(prefix);
+
+// Строки текста как в get_text(): без содержимого script и style
+const strings = el => {
+  const out = [];
+  const walk = node => {
+    for (const child of node.childNodes) {
+      if (child.nodeType === 3) out.push(child.data);
+      else if (child.nodeType === 1 && !['script', 'style'].includes(tag(child))) walk(child);
+    }
+  };
+  walk(el);
+  return out;
+};
+const text = el => strings(el).join('');
+const textStrip = el => strings(el).map(s => s.trim()).filter(Boolean).join('');
+
+// .string: текст единственного потомка (рекурсивно), иначе null
+const string = el => {
+  if (el.childNodes.length !== 1) return null;
+  const child = el.childNodes[0];
+  if (child.nodeType === 3) return child.data;
+  return child.nodeType === 1 ? string(child) : null;
+};
+
+// find, find_next, find_parent в порядке документа
+const find = (name, test) => all.find(el => tag(el) === name && test(el)) || null;
+const findIn = (root, name, test) => Array.from(root.getElementsByTagName(name)).find(test) || null;
+const findNext = (el, name, test) => {
+  for (let i = position.get(el) + 1; i < all.length; i++) {
+    if (tag(all[i]) === name && test(all[i])) return all[i];
+  }
+  return null;
+};
+const findParent = (el, name, test) => {
+  for (let parent = el.parentElement; parent; parent = parent.parentElement) {
+    if (tag(parent) === name && test(parent)) return parent;
+  }
+  return null;
+};
+const isLink = el => hasClass(el, 'link');
+
+const director = () => {
+  try {
+    let name = null, inn = null;
+    const isLabel = el => hasClass(el, 'fw-700') && (string(el) || '').toLowerCase().includes('директор');
+    const section = find('div', isLabel) || find('strong', isLabel);
+    if (section) {
+      const link = findNext(section, 'a', isLink);
+      if (link) {
+        name = textStrip(link);
+        const innTag = findNext(section, 'span', el => hasClass(el, 'copy'));
+        if (innTag) inn = textStrip(innTag);
+      } else {
+        const parent = findParent(section, 'div', el => hasClass(el, 'mb-3'));
+        const parentLink = parent && findIn(parent, 'a', isLink);
+        if (parentLink) {
+          name = textStrip(parentLink);
+          const innTag = findIn(parent, 'span', el => hasClass(el, 'copy'));
+          if (innTag) inn = textStrip(innTag);
+        }
+      }
+    }
+    return [name, inn];
+  } catch (e) {
+    return ['', ''];
+  }
+};
+
+const founder = () => {
+  try {
+    let name = null, inn = null;
+    const section = find('section', hasId('founders'));
+    const table = section && findIn(section, 'table', el => hasClass(el, 'table table-md'));
+    if (table) {
+      const rows = Array.from(table.getElementsByTagName('tr'));
+      if (rows.length) {
+        if (rows.length < 2) throw new Error('В таблице учредителей нет строки с данными');
+        const columns = Array.from(rows[1].getElementsByTagName('td'));
+        const link = columns.length >= 2 ? findIn(columns[1], 'a', any) : null;
+        if (link) {
+          name = textStrip(link);
+          if (name.includes('Показать на карте')) return ['', ''];
+          const innDiv = findNext(columns[1], 'div', any);
+          if (innDiv && text(innDiv).includes('ИНН')) inn = text(innDiv).trim().split(/\s+/).pop();
+        }
+      }
+    }
+
+    if (!name) {
+      const isLabel = el => hasClass(el, 'fw-700') && string(el) === 'Учредитель';
+      const label = find('strong', isLabel) || find('div', isLabel);
+      if (label) {
+        const link = findNext(label, 'a', isLink);
+        if (link) {
+          name = textStrip(link);
+        } else {
+          const parent = findParent(label, 'div', el => hasClass(el, 'mb-3'));
+          if (parent) {
+            const divs = Array.from(parent.children).filter(el => tag(el) === 'div');
+            if (divs.length > 0 && !text(divs[0]).includes('Субъект РФ')) {
+              name = textStrip(parent).replaceAll('Учредитель', '').trim();
+            } else if (divs.length > 0) {
+              name = null;
+            }
+          }
+        }
+      }
+    }
+    return [name, inn];
+  } catch (e) {
+    return ['', ''];
+  }
+};
+
+const okved = () => {
+  const section = find('section', hasId('activity'));
+  if (!section) return null;
+  try {
+    const table = findIn(section, 'table', el => hasClass(el, 'table table-sm table-striped'));
+    const rows = table ? table.getElementsByTagName('tr') : [];
+    if (!rows.length) return [null, null];
+    const columns = rows[0].getElementsByTagName('td');
+    if (columns.length < 2) return [null, null];
+    return [text(columns[0]).trim(), text(columns[1]).trim()];
+  } catch (e) {
+    return [null, null];
+  }
+};
+
+// Текст div после подписи; ошибка, если подпись есть, а значения нет (как AttributeError в Python)
+const labelValue = label => {
+  const labelTag = find('div', el => string(el) === label);
+  if (!labelTag) return null;
+  const value = findNext(labelTag, 'div', any);
+  if (!value) throw new Error(`Нет значения для "${label}"`);
+  return textStrip(value);
+};
+
+const innTag = find('strong', hasId('copy-inn'));
+const fields = {inn: innTag ? textStrip(innTag) : null, error: null};
+try {
+  fields.date = labelValue('Дата регистрации');
+  [fields.director, fields.director_inn] = director();
+  [fields.founder, fields.founder_inn] = founder();
+
+  const phones = [];
+  for (const div of all) {
+    if (tag(div) !== 'div' || !hasClass(div, 'col-12 col-lg-4') || !text(div).includes('Телефон')) continue;
+    for (const link of div.getElementsByTagName('a')) {
+      const phone = hrefStarts('tel:')(link) ? textStrip(link) : '';
+      if (phone && !phones.includes(phone)) phones.push(phone);
+    }
+  }
+  fields.phone = phones.length ? phones.join(', ') : null;
+
+  const emailTag = find('a', hrefStarts('mailto:'));
+  fields.email = emailTag ? textStrip(emailTag) : null;
+
+  const activity = okved();
+  if (!activity) throw new Error('Секция ОКВЭД не найдена');
+  [fields.okved_code, fields.okved_description] = activity;
+
+  const addressTag = find('span', hasId('copy-address'));
+  fields.legal_address = addressTag ? textStrip(addressTag) : null;
+  fields.charter_capital = labelValue('Уставный капитал');
+} catch (e) {
+  fields.error = String(e.message || e);
+}
+return fields;
+"""
+
+
+def make_soup(html, parser=None):
+    """Построение дерева BeautifulSoup выбранным парсером (по умолчанию HTML_PARSER)"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, parser or HTML_PARSER)
+
+
+def extract_company_data(html, url, existing_inns=None, parser=None):
+    """Извлечение данных компании из HTML страницы без участия драйвера"""
+    return extract_company_result(html, url, existing_inns, parser)[0]
+
+
+def extract_company_result(html, url, existing_inns=None, parser=None):
+    """Извлечение данных компании: (запись или None, ИНН, причина пропуска или None)"""
+    with METRICS.timed('html_parse'):
+        soup = make_soup(html, parser)
+    with METRICS.timed('html_index'):
+        index = PageIndex(soup)
+
+    fields = {}
+    for name, field_names, extract in COMPANY_EXTRACTORS:
+        with METRICS.timed(f"extract_{name}"):
+            fields.update(zip(field_names, extract(index)))
+
+        # Проверка дубликата по ИНН до разбора остальных полей
+        if name == 'inn':
+            inn = fields['inn']
+            if not inn:
+                print("Пропускаем - нет ИНН")
+                return None, None, 'no_inn'
+
+            if existing_inns is not None and inn in existing_inns:
+                print(f"Пропускаем дубликат ИНН: {inn}")
+                return None, inn, 'duplicate'
+
+    return build_company_result(url, fields)
+
+
+@dataclass(slots=True)
+class CompanyRecord:
+    """Запись о компании; поля - столбцы хранилища, to_dict() - прежний вид с русскими ключами"""
+    inn: str
+    registration_date: str = None
+    director: str = None
+    director_inn: str = None
+    founder: str = None
+    founder_inn: str = ''
+    phone: str = None
+    email: str = None
+    okved: str = None
+    legal_address: str = None
+    charter_capital: str = None
+    url: str = None
+    added_at: str = None
+    email_sent: bool = False
+
+    def to_row(self):
+        """Значения в порядке RECORD_COLUMNS"""
+        return [getattr(self, column) for column in RECORD_COLUMNS.values()]
+
+    def to_dict(self):
+        """Словарь с русскими ключами (строка records_frame, сверка извлечения)"""
+        return dict(zip(RECORD_COLUMNS, self.to_row()))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Запись из словаря с русскими ключами (обратное to_dict)"""
+        return cls(**{column: data.get(key) for key, column in RECORD_COLUMNS.items()})
+
+
+def records_frame(records):
+    """DataFrame в прежнем виде (русские заголовки) из записей CompanyRecord"""
+    import pandas as pd
+    return pd.DataFrame([record.to_dict() for record in records], columns=list(RECORD_COLUMNS))
+
+
+def build_company_result(url, fields):
+    """Запись компании из извлеченных полей: (запись или None, ИНН, причина пропуска или None)"""
+    inn, phone, email = fields['inn'], fields['phone'], fields['email']
+    if not phone and not email:
+        print("Пропускаем - нет ни телефона, ни email")
+        return None, inn, 'no_contacts'
+
+    record = CompanyRecord(
+        inn=inn,
+        registration_date=fields['date'],
+        director=fields['director'],
+        director_inn=fields['director_inn'],
+        founder=fields['founder'],
+        founder_inn=fields['founder_inn'] if fields['founder_inn'] else '',  # ИНН учредителя, если найден
+        phone=phone,
+        email=email,
+        okved=f"{fields['okved_code']} - {fields['okved_description']}",
+        legal_address=fields['legal_address'],
+        charter_capital=fields['charter_capital'],
+        url=url,
+        added_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    )
+    logger.debug(f"Данные: {record}")
+    return record, inn, None
+
+
+def extract_company_result_js(driver, url, existing_inns=None):
+    """Извлечение данных компании одним вызовом JS в открытой странице (без передачи page_source)"""
+    with METRICS.timed('extract_js'):
+        fields = driver.execute_script(EXTRACT_COMPANY_JS)
+
+    inn = fields['inn']
+    if not inn:
+        print("Пропускаем - нет ИНН")
+        return None, None, 'no_inn'
+
+    if existing_inns is not None and inn in existing_inns:
+        print(f"Пропускаем дубликат ИНН: {inn}")
+        return None, inn, 'duplicate'
+
+    # Страница, на которой разбор в Python упал бы с исключением
+    if fields['error']:
+        raise ValueError(f"Ошибка извлечения в браузере: {fields['error']}")
+
+    return build_company_result(url, fields)
+
+
+def verify_js_extraction(driver, url, html):
+    """Сверка извлечения в браузере с разбором page_source в Python; расхождения - в лог и метрики"""
+    expected = extract_company_result(html, url)
     try:
-        driver.get(url)
-        debug_screenshot(driver, f"company_page_{url.split('/')[-1]}")
+        actual = extract_company_result_js(driver, url)
+    except Exception as e:
+        actual = (None, None, f"error: {str(e)}")
+
+    expected_record = expected[0].to_dict() if expected[0] else {}
+    actual_record = actual[0].to_dict() if actual[0] else {}
+    mismatches = [key for key in RECORD_COLUMNS if key != 'Дата добавления'
+                  and expected_record.get(key) != actual_record.get(key)]
+    if expected[1:] != actual[1:]:
+        mismatches.append('result')
+
+    for key in mismatches:
+        METRICS.inc('extraction_mismatch', field=RECORD_COLUMNS.get(key, key))
+        if key == 'result':
+            logger.warning(f"JS-извлечение {url}: {actual[1:]} вместо {expected[1:]}")
+        else:
+            logger.warning(f"JS-извлечение {url}: {key} = {actual_record.get(key)!r} вместо {expected_record.get(key)!r}")
+    return not mismatches
 
-        # Ожидаем либо данные, либо капчу
-        WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
-            lambda d: d.find_elements(By.ID, "copy-inn") or
-                      d.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']")
-        )
 
-        # Если есть капча - обрабатываем
-        if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
-            if not handle_captcha(driver):
-                return None
+_company_index = None
+_company_index_lock = threading.Lock()
 
-        # Дожидаемся загрузки данных
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "copy-inn"))
-        )
 
-        # Парсинг данных
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+def company_slug(url):
+    """Идентификатор компании из ее адреса (последняя часть пути)"""
+    return url.rstrip('/').split('/')[-1]
 
-        # Прокручиваем страницу (может появиться капча)
-        driver.execute_script("window.scrollTo(0, 5000);")
-        time.sleep(1)
 
-        # Проверяем капчу после прокрутки
-        if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
-            if not handle_captcha(driver):
-                return None
+def load_company_index():
+    """Индекс известных компаний адрес -> (ИНН, когда видели), загружается из хранилища один раз"""
+    global _company_index
+    storage = get_storage()
+    with _company_index_lock:
+        if _company_index is None:
+            with _storage_lock:
+                storage.execute("CREATE TABLE IF NOT EXISTS company_index "
+                                "(slug TEXT PRIMARY KEY, inn TEXT NOT NULL, last_seen TEXT NOT NULL)")
+                storage.commit()
+                rows = storage.execute("SELECT slug, inn, last_seen FROM company_index").fetchall()
+            _company_index = {slug: (inn, last_seen) for slug, inn, last_seen in rows}
+            logger.info(f"В индексе {len(_company_index)} известных компаний")
+        return _company_index
 
-        # Основные данные
-        inn = None
-        try:
-            inn = soup.find('strong', id='copy-inn').get_text(strip=True) if soup.find('strong',
-                                                                                       id='copy-inn') else None
-        except Exception as e:
-            print(f"Ошибка при извлечении ИНН: {e}")
 
-        # Проверка дубликата по ИНН
-        if not inn:
-            print("Пропускаем - нет ИНН")
-            return None
+def is_known_company(url):
+    """Компания уже загружалась (и еще не устарела по KNOWN_COMPANY_MAX_AGE_DAYS)"""
+    entry = load_company_index().get(company_slug(url))
+    if entry is None:
+        return False
+    if KNOWN_COMPANY_MAX_AGE_DAYS is None:
+        return True
+    last_seen = datetime.strptime(entry[1], '%Y-%m-%d %H:%M:%S')
+    return datetime.now() - last_seen < timedelta(days=KNOWN_COMPANY_MAX_AGE_DAYS)
 
-        if inn in existing_inns:
-            print(f"Пропускаем дубликат ИНН: {inn}")
-            return None
 
-        date = soup.find('div', string='Дата регистрации').find_next('div').get_text(strip=True) if soup.find('div',
-                                                                                                              string='Дата регистрации') else None
-
-        # Директор и учредитель
-        director, director_inn = get_person_info(soup, 'Генеральный директор') or get_person_info(soup, 'Директор')
-        founder, founder_inn = get_person_info(soup, 'Учредитель')
-
-        # Телефоны
-        phones = []
-        phone_divs = soup.find_all('div', class_='col-12 col-lg-4')
-        for div in phone_divs:
-            if 'Телефон' in div.get_text():
-                phone_links = div.find_all('a', href=lambda x: x and x.startswith('tel:'))
-                for link in phone_links:
-                    phone = link.get_text(strip=True)
-                    if phone and phone not in phones:
-                        phones.append(phone)
-
-        phone = ', '.join(phones) if phones else None
-
-        # Email
-        email_tag = soup.find('a', href=lambda x: x and x.startswith('mailto:'))
-        email = email_tag.get_text(strip=True) if email_tag else None
-
-        # Получаем первый ОКВЭД
-        okved_code, okved_description = get_first_okved(soup)
-
-        # Извлекаем юридический адрес
-        legal_address = None
-        address_tag = soup.find('span', id='copy-address')
-        if address_tag:
-            legal_address = address_tag.get_text(strip=True)
-
-        # Извлекаем уставной капитал
-        charter_capital = None
-        capital_tag = soup.find('div', string="Уставный капитал")
-        if capital_tag:
-            # Получаем следующий элемент, который содержит текст с уставным капиталом
-            charter_capital = capital_tag.find_next('div').get_text(strip=True)
-
-        # Проверяем обязательные поля
-        if not inn:
-            print("Пропускаем - нет ИНН")
-            return None
+def remember_company(url, inn):
+    """Запись компании в индекс, чтобы следующие запуски не загружали ее страницу"""
+    index = load_company_index()
+    slug = company_slug(url)
+    last_seen = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with _company_index_lock:
+        index[slug] = (inn, last_seen)
 
-        if not phone and not email:
-            print("Пропускаем - нет ни телефона, ни email")
-            return None
+    storage = get_storage()
+    with _storage_lock:
+        storage.execute("INSERT INTO company_index (slug, inn, last_seen) VALUES (?, ?, ?) "
+                        "ON CONFLICT (slug) DO UPDATE SET inn = excluded.inn, last_seen = excluded.last_seen",
+                        (slug, inn, last_seen))
+        storage.commit()
 
-        # Формируем строку для таблицы
-        current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(
-            f"Данные: ИНН={inn}, Дата={date}, Директор={director}, Учредитель={founder}, Телефон={phone}, Email={email}, ОКВЭД={okved_code} - {okved_description}, Юридический адрес={legal_address}, Уставной капитал={charter_capital}")
 
-        return {
-            'ИНН': inn,
-            'Дата регистрации': date,
-            'Ген. директор': director,
-            'ИНН директора': director_inn,  # Добавляем ИНН директора
-            'Учредитель': founder,
-            'ИНН учредителя': founder_inn if founder_inn else '',  # Добавляем ИНН учредителя, если найден
-            'Телефон': phone,
-            'Email': email,
-            'ОКВЭД': f"{okved_code} - {okved_description}",  # Добавляем ОКВЭД
-            'Юридический адрес': legal_address,  # Добавляем юридический адрес
-            'Уставной капитал': charter_capital,  # Добавляем уставной капитал
-            'URL': url,
-            'Дата добавления': current_date,
-            'EmailSent': False  # Флаг отправки письма
-        }
+def known_inns():
+    """ИНН всех компаний из индекса"""
+    return {inn for inn, _ in load_company_index().values()}
+
+
+def skip_known_companies(company_links, month_name):
+    """Отбрасывает ссылки на компании из индекса до загрузки их страниц"""
+    skipped = 0
+    for link in company_links:
+        if is_known_company(link):
+            skipped += 1
+            METRICS.inc('skipped', reason='known')
+            continue
+        yield link
+
+    if skipped:
+        logger.info(f"Пропущено {skipped} уже известных компаний за {month_name}")
+
 
+def extract_or_skip(html, url, existing_inns=None):
+    """extract_company_result, но ошибка разбора - пропуск 'parse_error', а не сбой: страница уже
+    загружена (и в кэше), повтор из dead letters разберет тот же HTML и упадет снова"""
+    try:
+        return extract_company_result(html, url, existing_inns)
+    except Exception as e:
+        logger.warning(f"Ошибка разбора страницы компании {url}: {str(e)}")
+        return None, None, 'parse_error'
+
+
+def extract_and_remember(html, url, existing_inns):
+    """Извлечение данных компании с записью ее ИНН в индекс"""
+    return remember_result(url, extract_or_skip(html, url, existing_inns))
+
+
+def remember_result(url, result):
+    """Запись ИНН из результата извлечения в индекс; возвращает запись или None"""
+    company_data, inn, skip_reason = result
+    if inn:
+        remember_company(url, inn)
+    if skip_reason:
+        METRICS.inc('skipped', reason=skip_reason)
+    return company_data
+
+
+def parse_company_page(driver, url, existing_inns, month_name=None, http=True):
+    """Парсинг данных компании с проверкой дубликатов по ИНН и повторами при сбоях; None - компания пропущена
+    или не загрузилась (тогда ссылка отложена в dead letters, если известен месяц month_name).
+    http=False - страницу сразу открывает браузер (HTTP-ответ уже оказался без данных компании)"""
+    print(f"\nОбрабатываем компанию: {url}")
+    try:
+        return with_retries(lambda attempt: _parse_company_page(driver, url, existing_inns, http),
+                            f"Компания {url}")
     except Exception as e:
-        debug_screenshot(driver, f"parse_error_{url.split('/')[-1]}")
+        METRICS.inc('errors', kind='company_page')
+        debug_failure(driver, f"parse_error_{company_slug(url)}")
         print(f"Ошибка при парсинге компании: {str(e)}")
+        if month_name:
+            dead_letter_add('company', url, e, month_name)
         return None
 
 
-def save_to_excel(data, filepath):
-    """Сохранение данных в Excel с проверкой дубликатов"""
+def _parse_company_page(driver, url, existing_inns, http=True):
+    """Одна попытка загрузки и разбора страницы компании; сбой - исключение"""
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    # Страница уже есть в кэше - браузер не нужен
+    html = cache_get(url)
+
+    # Серверная страница по HTTP дешевле полной загрузки в браузере
+    if html is None and http and FETCH_MODE == 'http':
+        get_rate_limiter().acquire()
+        html = fetch_html_http(url)
+        if html is not None:
+            cache_put(url, html)
+        else:
+            print("HTTP-ответ без данных компании, загружаем через браузер")
+
+    if html is not None:
+        debug_remember(f"company_{company_slug(url)}", html)
+        return extract_and_remember(html, url, existing_inns)
+
+    get_rate_limiter().acquire()
+    load_started = time.perf_counter()
+    with METRICS.timed('company_get'):
+        driver.get(url)
+    debug_screenshot(driver, f"company_page_{company_slug(url)}")
+
+    # Ожидаем либо данные, либо капчу
+    try:
+        wait_for(driver, 'company_page', lambda d: d.find_elements(By.ID, "copy-inn") or
+                                                   d.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"))
+    except TimeoutException:
+        # Документ загружен, но без данных компании (заглушка или ошибка сайта) - это не таймаут загрузки
+        if page_ready(driver):
+            raise FetchFailure('no_inn', "На странице компании нет ИНН (#copy-inn)")
+        raise
+
+    # Если есть капча - обрабатываем
+    if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
+        if not handle_captcha(driver):
+            raise FetchFailure('captcha', "Не удалось решить капчу на странице компании")
+
+    # Дожидаемся загрузки данных
+    try:
+        wait_for(driver, 'copy_inn', EC.presence_of_element_located((By.ID, "copy-inn")))
+    except TimeoutException:
+        raise FetchFailure('no_inn', "На странице компании не появился ИНН (#copy-inn)")
+    METRICS.observe('time_to_copy_inn', time.perf_counter() - load_started)
+    record_page_transfer(driver, 'company')
+
+    if EXTRACTION_MODE == 'js':
+        # Поля собираются в странице, по сети передается только компактный JSON
+        result = extract_company_result_js(driver, url, existing_inns)
+    else:
+        # Забираем HTML, разбор выполняется отдельно от драйвера
+        html = driver.page_source
+        cache_put(url, html)
+        debug_remember(f"company_{company_slug(url)}", html)
+        if EXTRACTION_MODE == 'verify':
+            verify_js_extraction(driver, url, html)
+
+    # Прокручиваем страницу (может появиться капча)
+    driver.execute_script("window.scrollTo(0, 5000);")
+    wait_for(driver, 'scroll', page_ready, required=False)
+
+    # Проверяем капчу после прокрутки
+    if driver.find_elements(By.CSS_SELECTOR, "iframe[title*='reCAPTCHA']"):
+        if not handle_captcha(driver):
+            raise FetchFailure('captcha', "Не удалось решить капчу после прокрутки страницы компании")
+
+    # После капчи в браузере HTTP-запросам нужны те же cookies
+    if FETCH_MODE == 'http':
+        sync_session_cookies(driver)
+
+    if EXTRACTION_MODE == 'js':
+        return remember_result(url, result)
+    return extract_and_remember(html, url, existing_inns)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Соединение с хранилищем записей (общее для всех потоков, доступ под _storage_lock)"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = sqlite3.connect(STORAGE_PATH, check_same_thread=False)
+            _storage.execute("PRAGMA journal_mode=WAL")
+            _storage.execute("PRAGMA synchronous=NORMAL")
+            columns = ', '.join(f"{column} TEXT" for column in RECORD_COLUMNS.values() if column != 'inn')
+            _storage.execute(f"CREATE TABLE IF NOT EXISTS companies (inn TEXT PRIMARY KEY, month TEXT, {columns})")
+            _storage.execute("CREATE INDEX IF NOT EXISTS companies_month ON companies (month)")
+            _storage.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Отложенные после сбоев ссылки компаний и окна выдачи (url - ключ страницы выдачи, с нее продолжить окно)
+            _storage.execute("CREATE TABLE IF NOT EXISTS dead_letters (url TEXT PRIMARY KEY, task TEXT NOT NULL, "
+                             "month TEXT, window_start TEXT, window_end TEXT, page INTEGER, kind TEXT NOT NULL, "
+                             "error TEXT, attempts INTEGER NOT NULL, failed_at TEXT NOT NULL)")
+            _storage.commit()
+        return _storage
+
+
+def save_records(records, month_name):
+    """Upsert записей в хранилище: стоимость не зависит от того, сколько записей уже сохранено"""
+    if not records:
+        return
+
+    columns = ['month'] + list(RECORD_COLUMNS.values())
+    # Дата добавления и флаг отправки письма остаются от первой записи компании
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns
+                        if column not in ('inn', 'added_at', 'email_sent'))
+    rows = [[month_name] + record.to_row() for record in records]
+
+    storage = get_storage()
+    with _storage_lock, METRICS.timed('save'):
+        storage.executemany(
+            f"INSERT INTO companies ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (inn) DO UPDATE SET {updates}",
+            rows
+        )
+        storage.commit()
+
+
+_record_sink = None
+_record_sink_lock = threading.Lock()
+
+
+class RecordSink:
+    """Файл, в который новые записи дописываются сразу после разбора (JSONL или CSV)"""
+
+    def __init__(self, path, sink_format):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.path = path
+        self._format = sink_format
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._lock = threading.Lock()
+        self._written = 0
+        if sink_format == 'csv':
+            self._writer = csv.writer(self._file)
+            if new_file:
+                self._writer.writerow(['month', *RECORD_COLUMNS.values()])
+
+    def write(self, record, month_name):
+        with self._lock:
+            if self._format == 'csv':
+                self._writer.writerow([month_name, *record.to_row()])
+            else:
+                self._file.write(json.dumps({'month': month_name, **asdict(record)}, ensure_ascii=False) + '\n')
+            # Запись видна читателям файла сразу, на диск сбрасываем пачками
+            self._file.flush()
+            self._written += 1
+            if self._written % RECORD_SINK_FSYNC_EVERY == 0:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def get_record_sink():
+    """Поток записей RECORD_SINK (создается при первой записи) или None"""
+    global _record_sink
+    if not RECORD_SINK:
+        return None
+    with _record_sink_lock:
+        if _record_sink is None:
+            _record_sink = RecordSink(RECORD_SINK_PATH.format(format=RECORD_SINK), RECORD_SINK)
+        return _record_sink
+
+
+def close_record_sink():
+    global _record_sink
+    with _record_sink_lock:
+        if _record_sink is not None:
+            _record_sink.close()
+            _record_sink = None
+
+
+_run_months = set()  # Месяцы, в которые за этот запуск добавлены записи (их выгружает main)
+
+
+def emit_record(record, month_name):
+    """Новая запись: в хранилище и в поток записей"""
+    save_records([record], month_name)
+    _run_months.add(month_name)
+    sink = get_record_sink()
+    if sink is not None:
+        sink.write(record, month_name)
+    METRICS.inc('records_saved')
+
+
+def load_records(month_name=None):
+    """Записи CompanyRecord из хранилища (все или за месяц); records_frame(load_records()) - прежний DataFrame"""
+    storage = get_storage()
+    query = f"SELECT {', '.join(RECORD_COLUMNS.values())} FROM companies"
+    params = ()
+    if month_name:
+        query += " WHERE month = ?"
+        params = (month_name,)
+
+    with _storage_lock:
+        rows = storage.execute(query + " ORDER BY rowid", params).fetchall()
+
+    records = []
+    for row in rows:
+        record = CompanyRecord.from_dict(dict(zip(RECORD_COLUMNS, row)))
+        record.email_sent = record.email_sent in (1, '1', 'True')
+        records.append(record)
+    return records
+
+
+def stored_months():
+    """Месяцы, за которые в хранилище есть записи"""
+    storage = get_storage()
+    with _storage_lock:
+        return [row[0] for row in storage.execute("SELECT DISTINCT month FROM companies ORDER BY month")]
+
+
+def get_watermark():
+    """Самая поздняя дата регистрации, до которой инкрементальный режим обработал все дни (или None)"""
+    storage = get_storage()
+    with _storage_lock:
+        row = storage.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+    return datetime.strptime(row[0], '%Y-%m-%d') if row else None
+
+
+def set_watermark(day):
+    """Сдвиг watermark вперед (назад не двигается)"""
+    watermark = get_watermark()
+    if watermark is not None and day <= watermark:
+        return
+
+    storage = get_storage()
+    with _storage_lock:
+        storage.execute("INSERT INTO meta (key, value) VALUES ('watermark', ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (day.strftime('%Y-%m-%d'),))
+        storage.commit()
+
+
+def dead_letter_add(task, url, error, month_name, start_date=None, end_date=None, page=None):
+    """Откладывает ссылку компании (task='company') или остаток окна выдачи со страницы page (task='listing');
+    attempts - число неудачных повторов: первый сбой записывается с 0, каждая неудача повтора добавляет 1"""
+    kind = classify_failure(error)
+    failed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    window = [day.strftime('%Y-%m-%d') if day else None for day in (start_date, end_date)]
+
+    storage = get_storage()
+    with _storage_lock:
+        storage.execute(
+            "INSERT INTO dead_letters (url, task, month, window_start, window_end, page, kind, error, attempts, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?) ON CONFLICT (url) DO UPDATE SET kind = excluded.kind, "
+            "error = excluded.error, attempts = attempts + 1, failed_at = excluded.failed_at",
+            (url, task, month_name, *window, page, kind, str(error)[:1000], failed_at))
+        storage.commit()
+    METRICS.inc('dead_letters', task=task, kind=kind)
+    logger.warning(f"Отложено для повтора ({task}, {kind}): {url}")
+
+
+def pending_dead_letters():
+    """Отложенные записи, которые еще можно повторить (меньше DEAD_LETTER_MAX_ATTEMPTS неудачных повторов)"""
+    storage = get_storage()
+    with _storage_lock:
+        rows = storage.execute(
+            "SELECT url, task, month, window_start, window_end, page, attempts FROM dead_letters "
+            "WHERE attempts < ? ORDER BY rowid", (DEAD_LETTER_MAX_ATTEMPTS,)).fetchall()
+    return [dict(zip(('url', 'task', 'month', 'window_start', 'window_end', 'page', 'attempts'), row)) for row in rows]
+
+
+def dead_letter_resolve(url, attempts):
+    """Удаляет отложенную запись, если повтор прошел (при новой неудаче число попыток уже выросло)"""
+    storage = get_storage()
+    with _storage_lock:
+        cursor = storage.execute("DELETE FROM dead_letters WHERE url = ? AND attempts = ?", (url, attempts))
+        storage.commit()
+    return cursor.rowcount > 0
+
+
+def iter_stored_rows(month_name):
+    """Строки месяца из хранилища по одной (отдельное соединение на чтение, без загрузки месяца в память)"""
+    connection = sqlite3.connect(STORAGE_PATH)
+    try:
+        cursor = connection.execute(
+            f"SELECT {', '.join(RECORD_COLUMNS.values())} FROM companies WHERE month = ? ORDER BY rowid", (month_name,))
+        yield from cursor
+    finally:
+        connection.close()
+
+
+def sorted_months(month_names):
+    """Месяцы в хронологическом порядке (названия вида 'may 2025')"""
+    def month_date(month_name):
+        try:
+            return datetime.strptime(month_name, "%B %Y")
+        except ValueError:
+            return datetime.max
+    return sorted(month_names, key=lambda month_name: (month_date(month_name), month_name))
+
+
+def excel_row(row):
+    """Значения с типами для xlsx: даты - датами, капитал - числом, флаг - логическим, ИНН остаются текстом"""
+    values = dict(zip(RECORD_COLUMNS.values(), row))
+    for column, date_format in (('registration_date', '%d.%m.%Y'), ('added_at', '%Y-%m-%d %H:%M:%S')):
+        try:
+            values[column] = datetime.strptime(values[column], date_format)
+        except (TypeError, ValueError):
+            pass
+
+    capital = re.sub(r'[^\d,.]', '', values['charter_capital'] or '').replace(',', '.')
     try:
-        # Загрузка существующих данных, если файл уже есть
-        if os.path.exists(filepath):
-            existing_df = pd.read_excel(filepath)
-            existing_inns = set(existing_df['ИНН'].dropna().astype(str))
+        values['charter_capital'] = float(capital)
+    except ValueError:
+        pass
+
+    values['email_sent'] = values['email_sent'] in (1, '1', 'True')
+    return list(values.values())
+
+
+def export_workbook(filepath=None, month_names=None):
+    """Одна книга xlsx: сводка и лист на каждый месяц; строки пишутся потоком (write-only), память не растет"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    filepath = filepath or os.path.join(OUTPUT_DIR, OUTPUT_WORKBOOK)
+    month_names = sorted_months(month_names if month_names is not None else stored_months())
+
+    storage = get_storage()
+    with _storage_lock:
+        summary = {row[0]: row[1:] for row in storage.execute(
+            "SELECT month, COUNT(*), COUNT(NULLIF(phone, '')), COUNT(NULLIF(email, '')) FROM companies GROUP BY month")}
+
+    workbook = Workbook(write_only=True)
+    summary_sheet = workbook.create_sheet("Сводка")
+    summary_sheet.column_dimensions['A'].width = 20
+    summary_sheet.append(["Месяц", "Компаний", "С телефоном", "С email"])
+    for month_name in month_names:
+        summary_sheet.append([month_name, *summary.get(month_name, (0, 0, 0))])
+    exported = [summary.get(month_name, (0, 0, 0)) for month_name in month_names]
+    summary_sheet.append(["Всего", *(sum(values[i] for values in exported) for i in range(3))])
+
+    total = 0
+    for month_name in month_names:
+        sheet = workbook.create_sheet(month_name[:31])
+        sheet.freeze_panes = 'A2'
+        for column_letter, width in zip('ABCDEFGHIJKLMN', (14, 12, 30, 14, 30, 14, 24, 26, 40, 50, 14, 40, 19, 10)):
+            sheet.column_dimensions[column_letter].width = width
+        sheet.append(list(RECORD_COLUMNS))
+        for row in iter_stored_rows(month_name):
+            values = excel_row(row)
+            for i, number_format in ((1, 'DD.MM.YYYY'), (12, 'DD.MM.YYYY HH:MM:SS')):
+                if isinstance(values[i], datetime):
+                    values[i] = WriteOnlyCell(sheet, value=values[i])
+                    values[i].number_format = number_format
+            sheet.append(values)
+            total += 1
+
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    tmp_path = f"{filepath}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, filepath)
+    logger.info(f"Выгружено {total} компаний за {len(month_names)} мес. в книгу {filepath}")
+
+
+def export_month(month_name, filepath=None):
+    """Выгрузка месяца из хранилища в отдельный файл OUTPUT_FORMAT в OUTPUT_DIR (файл пересоздается)"""
+    filepath = filepath or os.path.join(OUTPUT_DIR, OUTPUT_FILENAME.format(month=month_name, format=OUTPUT_FORMAT))
+    if OUTPUT_FORMAT == 'xlsx':
+        export_workbook(filepath, [month_name])
+        return
+
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    count = 0
+    # utf-8-sig - чтобы Excel открывал кириллицу без настройки кодировки
+    with open(filepath, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(RECORD_COLUMNS))
+        for row in iter_stored_rows(month_name):
+            writer.writerow(row)
+            count += 1
+    logger.info(f"Выгружено {count} компаний в файл {filepath}")
+
+
+def export_results(month_names):
+    """Выгрузка после изменения месяцев month_names: сводная книга xlsx пересобирается из всех месяцев
+    хранилища (иначе пропали бы листы прошлых запусков), в csv перезаписываются только файлы month_names"""
+    if not month_names:
+        return
+    if OUTPUT_FORMAT == 'xlsx':
+        export_workbook()
+    else:
+        for month_name in month_names:
+            export_month(month_name)
+
+
+_checkpoint = None
+_checkpoint_lock = threading.Lock()
+_checkpoint_events = 0
+_resume_state = None
+
+
+def window_key(start_date, end_date):
+    """Ключ окна фильтра по датам в журнале"""
+    return f"{start_date.strftime('%Y-%m-%d')}:{end_date.strftime('%Y-%m-%d')}"
+
+
+def open_checkpoint(resume=False):
+    """Открытие журнала прогресса; без resume журнал начинается заново"""
+    global _checkpoint, _resume_state
+    if resume:
+        _resume_state = load_checkpoint()
+        logger.info(f"Продолжаем запуск: завершено окон {sum(w['done'] for w in _resume_state['windows'].values())}, "
+                    f"обработано компаний {len(_resume_state['processed'])}")
+    _checkpoint = open(CHECKPOINT_PATH, 'a' if resume else 'w', encoding='utf-8')
+    checkpoint_event('run', start=START_MONTH.strftime('%Y-%m-%d'), end=END_MONTH.strftime('%Y-%m-%d'),
+                     resume=resume)
+
+
+def close_checkpoint():
+    global _checkpoint
+    if _checkpoint is not None:
+        with _checkpoint_lock:
+            _checkpoint.flush()
+            os.fsync(_checkpoint.fileno())
+            _checkpoint.close()
+            _checkpoint = None
+
+
+def checkpoint_event(event, **fields):
+    """Запись события в журнал: строка JSON, сразу в файл, периодически с fsync"""
+    global _checkpoint_events
+    if _checkpoint is None:
+        return
+
+    line = json.dumps({'event': event, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **fields},
+                      ensure_ascii=False)
+    with _checkpoint_lock:
+        _checkpoint.write(line + '\n')
+        _checkpoint.flush()
+        _checkpoint_events += 1
+        if event == 'window_done' or _checkpoint_events % CHECKPOINT_FSYNC_EVERY == 0:
+            os.fsync(_checkpoint.fileno())
+
+
+def load_checkpoint():
+    """Состояние прерванного запуска по журналу: окна (страница, найденные ссылки, завершено) и обработанные адреса"""
+    state = {'windows': {}, 'processed': set()}
+    if not os.path.exists(CHECKPOINT_PATH):
+        return state
+
+    with open(CHECKPOINT_PATH, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Последняя строка могла не дописаться при сбое
+                continue
+
+            event = entry['event']
+            if event in ('window', 'page', 'window_done'):
+                window = state['windows'].setdefault(entry['window'], {'page': 0, 'links': [], 'done': False})
+                if event == 'page':
+                    window['page'] = max(window['page'], entry['page'])
+                    window['links'].extend(entry['links'])
+                elif event == 'window_done':
+                    window['done'] = True
+            elif event == 'url':
+                state['processed'].add(entry['url'])
+    return state
+
+
+def iter_window_links(driver, start_date, end_date, month_name, status=None):
+    """Ссылки окна с учетом журнала: сначала найденные, но не обработанные до сбоя, затем новые страницы
+    (status - как в iter_company_links)"""
+    key = window_key(start_date, end_date)
+    window = (_resume_state or {'windows': {}})['windows'].get(key, {'page': 0, 'links': []})
+    processed = _resume_state['processed'] if _resume_state else set()
+
+    pending = [link for link in window['links'] if link not in processed]
+    if pending:
+        logger.info(f"Из журнала продолжаем {len(pending)} компаний за {month_name}, выдача со страницы {window['page'] + 1}")
+
+    def on_page(page_num, links):
+        checkpoint_event('page', window=key, page=page_num, links=links)
+
+    new_links = iter_company_links(driver, start_date, end_date, start_page=window['page'] + 1, on_page=on_page,
+                                   status=status)
+    for link in itertools.chain(pending, new_links):
+        if link not in processed:
+            yield link
+
+
+def window_done(start_date, end_date):
+    """Окно уже полностью обработано в прерванном запуске"""
+    if _resume_state is None:
+        return False
+    return _resume_state['windows'].get(window_key(start_date, end_date), {}).get('done', False)
+
+
+def parse_company_links(driver, company_links, existing_inns, month_name, http=True):
+    """Парсинг компаний одним драйвером (company_links - список или генератор); возвращает число новых записей
+    (http - как в parse_company_page)"""
+    saved = 0
+    for i, link in enumerate(company_links, 1):
+        company_data = parse_company_page(driver, link, existing_inns, month_name, http)
+        # ИНН мог параллельно забрать другой воркер
+        if company_data and existing_inns.claim(company_data.inn):
+            emit_record(company_data, month_name)
+            saved += 1
+            checkpoint_event('url', url=link, outcome='saved')
         else:
-            existing_df = pd.DataFrame()
-            existing_inns = set()
+            if company_data:
+                METRICS.inc('skipped', reason='claimed')
+            checkpoint_event('url', url=link, outcome='skipped')
 
-        # Создаем DataFrame из новых данных
-        new_df = pd.DataFrame(data)
+        if i % 10 == 0:
+            logger.info(f"Обработано {i} компаний за {month_name}")
 
-        # Удаляем дубликаты среди новых данных
-        new_df = new_df.drop_duplicates(subset=['ИНН'])
+    return saved
 
-        # Фильтруем только новые записи
-        new_df = new_df[~new_df['ИНН'].isin(existing_inns)]
 
-        if new_df.empty:
-            logger.info("Нет новых данных для сохранения")
-            return
+_parse_pool = None
+_PIPELINE_DONE = object()  # Маркер конца потока записей
+
+
+def _init_parse_worker():
+    """Процесс разбора начинает со своих пустых метрик (а не с копии метрик родителя)"""
+    global METRICS
+    METRICS = Metrics()
+
 
-        # Объединяем с существующими данными
-        final_df = pd.concat([existing_df, new_df], ignore_index=True)
+def _extract_in_worker(html, url):
+    """Разбор в процессе пула: результат и метрики разбора для слияния в основном процессе"""
+    return extract_or_skip(html, url), METRICS.drain()
 
-        # Сохраняем результат
-        final_df.to_excel(filepath, index=False)
-        logger.info(f"Сохранено {len(new_df)} новых записей. Всего записей: {len(final_df)}")
 
+def get_parse_pool():
+    """Пул процессов для разбора HTML (создается один раз на запуск)"""
+    from concurrent.futures import ProcessPoolExecutor
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=_init_parse_worker)
+    return _parse_pool
+
+
+async def _fetch_stage(link_queue, parse_queue, fallback_links):
+    """Загрузчик: берет ссылки из очереди, соблюдает общий лимит запросов и отдает HTML на разбор"""
+    import asyncio
+    limiter = get_rate_limiter()
+    while True:
+        link = await link_queue.get()
+        if link is None:
+            return
+
+        html = await asyncio.to_thread(cache_get, link)
+        if html is None:
+            await limiter.acquire_async()
+            html = await asyncio.to_thread(fetch_html_http, link)
+            if html is None:
+                # Странице нужен браузер - обработаем после конвейера
+                fallback_links.append(link)
+                continue
+            await asyncio.to_thread(cache_put, link, html)
+        debug_remember(f"company_{company_slug(link)}", html)
+
+        # Очередь ограничена: если разбор не успевает, загрузчики ждут
+        await parse_queue.put((link, html))
+
+
+async def _parse_stage(parse_queue, record_queue, month_name):
+    """Разборщик: извлекает данные компании в пуле процессов (ошибка разбора - пропуск 'parse_error',
+    сбой самого пула откладывает ссылку в dead letters)"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await parse_queue.get()
+        if item is None:
+            return
+
+        link, html = item
+        try:
+            result, metrics = await loop.run_in_executor(get_parse_pool(), _extract_in_worker, html, link)
+        except Exception as e:
+            print(f"Ошибка при парсинге компании {link}: {str(e)}")
+            METRICS.inc('errors', kind='parse')
+            await asyncio.to_thread(dead_letter_add, 'company', link, e, month_name)
+            # Ссылка отложена в dead letters - при --resume заново ее не загружаем (как в parse_company_links)
+            checkpoint_event('url', url=link, outcome='error')
+            continue
+        await record_queue.put((link, result, metrics))
+
+
+async def _link_stage(company_links, link_queue):
+    """Источник ссылок: генератор выдачи читается в отдельном потоке, ссылки сразу идут загрузчикам"""
+    import asyncio
+    links = iter(company_links)
+    while True:
+        link = await asyncio.to_thread(next, links, None)
+        if link is None:
+            break
+        await link_queue.put(link)
+
+    for _ in range(FETCH_CONCURRENCY):
+        await link_queue.put(None)
+
+
+async def _write_stage(record_queue, existing_inns, month_name):
+    """Запись: отбрасывает дубликаты по ИНН и сохраняет новые записи; возвращает их число"""
+    processed = 0
+    saved = 0
+    while True:
+        item = await record_queue.get()
+        if item is _PIPELINE_DONE:
+            return saved
+
+        link, (company_data, inn, skip_reason), metrics = item
+        METRICS.merge(metrics)
+        if inn:
+            remember_company(link, inn)
+
+        processed += 1
+        if company_data and existing_inns.claim(company_data.inn):
+            emit_record(company_data, month_name)
+            saved += 1
+            checkpoint_event('url', url=link, outcome='saved')
+        else:
+            skip_reason = skip_reason or 'duplicate'
+            checkpoint_event('url', url=link, outcome=skip_reason)
+            METRICS.inc('skipped', reason=skip_reason)
+
+        if processed % 10 == 0:
+            logger.info(f"Обработано {processed} компаний за {month_name}")
+
+
+async def run_company_pipeline(company_links, existing_inns, month_name):
+    """Конвейер ссылки -> загрузка -> разбор -> запись; возвращает (число новых записей, ссылки, которым нужен браузер)
+
+    company_links может быть генератором выдачи: загрузка компаний начинается, пока листаются страницы.
+    """
+    import asyncio
+    link_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    parse_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    record_queue = asyncio.Queue()
+    fallback_links = []
+
+    producer = asyncio.create_task(_link_stage(company_links, link_queue))
+    fetchers = [asyncio.create_task(_fetch_stage(link_queue, parse_queue, fallback_links))
+                for _ in range(FETCH_CONCURRENCY)]
+    parsers = [asyncio.create_task(_parse_stage(parse_queue, record_queue, month_name)) for _ in range(PARSE_WORKERS)]
+    writer = asyncio.create_task(_write_stage(record_queue, existing_inns, month_name))
+
+    # Останавливаем стадии по очереди: каждая завершается, когда предыдущая все отдала
+    await producer
+    await asyncio.gather(*fetchers)
+    for _ in parsers:
+        await parse_queue.put(None)
+    await asyncio.gather(*parsers)
+    await record_queue.put(_PIPELINE_DONE)
+    saved = await writer
+
+    return saved, fallback_links
+
+
+def _open_window(driver, start_date, end_date):
+    """Открытие поиска и применение фильтров окна с повторами; не вышло - исключение"""
+    # Окно только что проверял plan_date_shards - его выдача уже открыта
+    if getattr(driver, 'filtered_window', None) == (start_date, end_date):
+        return
+
+    def attempt_open(attempt):
+        # Переходим на страницу поиска (загрузку панели фильтров ждет apply_date_filters)
+        get_rate_limiter().acquire()
+        driver.get(BASE_URL)
+        if not apply_date_filters(driver, start_date, end_date):
+            raise FetchFailure('filter', f"Не удалось применить фильтры окна {window_key(start_date, end_date)}")
+
+    with_retries(attempt_open, f"Окно {window_key(start_date, end_date)}")
+
+
+def open_window(driver, start_date, end_date, page=1):
+    """Открытие поиска и применение фильтров окна с повторами; не вышло - окно со страницы page
+    откладывается в dead letters и возвращается False"""
+    try:
+        _open_window(driver, start_date, end_date)
+        return True
     except Exception as e:
-        logger.error(f"Ошибка при сохранении: {str(e)}")
-        raise
+        dead_letter_add('listing', listing_cache_url(start_date, end_date, page), e,
+                        start_date.strftime("%B %Y").lower(), start_date, end_date, page)
+        return False
 
 
 def process_month(driver, start_date, end_date, existing_inns):
-    """Обработка одного месяца"""
+    """Обработка окна дат - месяца или его части (записи сохраняются по мере парсинга); возвращает
+    (existing_inns, число новых записей или None, если окно не обработано)"""
     month_name = start_date.strftime("%B %Y").lower()
-    output_file = f"{month_name}.xlsx"
-    all_data = []
 
-    logger.info(f"\nНачинаем обработку месяца: {month_name}")
+    logger.info(f"\nНачинаем обработку окна {window_key(start_date, end_date)} ({month_name})")
 
-    # Переходим на страницу поиска
-    driver.get(BASE_URL)
-    time.sleep(3)
+    if window_done(start_date, end_date):
+        logger.info(f"Окно {window_key(start_date, end_date)} уже обработано в прерванном запуске, пропускаем")
+        return existing_inns, 0
+    checkpoint_event('window', window=window_key(start_date, end_date))
 
-    # Применяем фильтры
-    if not apply_date_filters(driver, start_date, end_date):
-        return existing_inns, []
+    # Применяем фильтры (None вместо числа записей - окно не обработано и отложено)
+    if not open_window(driver, start_date, end_date):
+        return existing_inns, None
 
-    # Собираем все ссылки на компании
-    company_links = get_all_company_links(driver)
-    logger.info(f"Найдено {len(company_links)} компаний за {month_name}")
-
-    if not company_links:
-        logger.info(f"Нет компаний за {month_name}, пропускаем")
-        return existing_inns, []
+    # Ссылки на компании читаются по мере листания выдачи, парсинг начинается с первой страницы
+    status = {}
+    company_links = skip_known_companies(iter_window_links(driver, start_date, end_date, month_name, status),
+                                         month_name)
 
     # Парсим данные компаний
-    for i, link in enumerate(company_links, 1):
-        company_data = parse_company_page(driver, link, existing_inns)
-        if company_data:
-            all_data.append(company_data)
-            existing_inns.add(company_data['ИНН'])
+    if FETCH_MODE == 'http' and ASYNC_PIPELINE:
+        import asyncio
+        saved, fallback_links = asyncio.run(run_company_pipeline(company_links, existing_inns, month_name))
+        if fallback_links:
+            logger.info(f"{len(fallback_links)} компаний за {month_name} загружаем через браузер")
+            # Эти страницы конвейер уже запрашивал по HTTP - повторный запрос ничего не даст
+            saved += parse_company_links(driver, fallback_links, existing_inns, month_name, http=False)
+    else:
+        saved = parse_company_links(driver, company_links, existing_inns, month_name)
+
+    if not status.get('complete'):
+        # Остаток выдачи отложен в dead letters - окно не завершено, при возобновлении его листаем снова
+        logger.warning(f"Окно {window_key(start_date, end_date)} пролистано не до конца, "
+                       f"сохранено {saved} новых компаний за {month_name}")
+        write_metrics()
+        return existing_inns, None
+
+    checkpoint_event('window_done', window=window_key(start_date, end_date))
+    write_metrics()
+    if saved:
+        logger.info(f"Сохранено {saved} новых компаний за {month_name}")
+    else:
+        logger.info(f"Нет новых компаний за {month_name}")
 
-        if i % 10 == 0:
-            logger.info(f"Обработано {i}/{len(company_links)} компаний за {month_name}")
+    return existing_inns, saved
+
+
+def reextract_month(start_date, end_date, existing_inns):
+    """Пересборка записей месяца из кэша страниц, без браузера; возвращает (existing_inns, число записей)"""
+    month_name = start_date.strftime("%B %Y").lower()
+    batch = []
+    saved = 0
+
+    logger.info(f"\nПересобираем месяц из кэша: {month_name}")
+
+    # Восстанавливаем список компаний по сохраненным страницам выдачи всех окон месяца:
+    # выдача могла кэшироваться целым месяцем, частями plan_date_shards или днями инкрементального режима
+    company_links = []
+    seen_links = set()
+    pages = 0
+    for window_start, window_end in shard_tree(start_date, end_date):
+        page_num = 1
+        while True:
+            html = cache_get(listing_cache_url(window_start, window_end, page_num), ttl=float('inf'))
+            if html is None:
+                break
+            links, no_results = parse_listing_page(html)
+            if no_results:
+                break
+            for link in links:
+                if link not in seen_links:
+                    seen_links.add(link)
+                    company_links.append(link)
+            page_num += 1
+        pages += page_num - 1
+
+    logger.info(f"В кэше {pages} страниц выдачи и {len(company_links)} компаний за {month_name}")
+
+    missing = 0
+    for link in company_links:
+        html = cache_get(link, ttl=float('inf'))
+        if html is None:
+            missing += 1
+            continue
+
+        try:
+            company_data = extract_company_data(html, link, existing_inns)
+        except Exception as e:
+            print(f"Ошибка при парсинге компании: {str(e)}")
+            continue
+
+        if company_data and existing_inns.claim(company_data.inn):
+            batch.append(company_data)
+
+        # Сохраняем пачками, чтобы не держать в памяти весь месяц
+        if len(batch) >= 500:
+            save_records(batch, month_name)
+            saved += len(batch)
+            batch = []
 
-        time.sleep(random.uniform(1, 3))
+    save_records(batch, month_name)
+    saved += len(batch)
 
-    # Сохраняем данные
-    if all_data:
-        save_to_excel(all_data, output_file)
-        logger.info(f"Сохранено {len(all_data)} компаний в файл {output_file}")
+    if missing:
+        logger.warning(f"Нет в кэше {missing} страниц компаний за {month_name}")
+
+    if saved:
+        logger.info(f"Пересобрано {saved} компаний за {month_name}")
     else:
-        logger.info(f"Нет новых компаний для сохранения за {month_name}")
+        logger.info(f"Нет данных в кэше за {month_name}")
+
+    return existing_inns, saved
+
 
-    return existing_inns, all_data
+def iter_months(start_date, end_date):
+    """Месяцы от start_date назад до end_date включительно: пары (первый день, последний день)"""
+    current_date = start_date
+    while current_date >= end_date:
+        month_start = current_date.replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        yield month_start, month_end
 
+        # Переходим к предыдущему месяцу
+        current_date = month_start - timedelta(days=1)
 
-def main():
-    """Основная функция парсера"""
-    driver = setup_driver()
+
+def incremental_windows(today=None):
+    """Однодневные окна от watermark - WATERMARK_OVERLAP_DAYS до сегодня (по возрастанию дат)"""
+    today = (today or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    watermark = get_watermark()
+    if watermark is None:
+        start_date = today - timedelta(days=INCREMENTAL_INITIAL_DAYS - 1)
+    else:
+        start_date = min(watermark - timedelta(days=WATERMARK_OVERLAP_DAYS), today)
+
+    days = []
+    day = start_date
+    while day <= today:
+        days.append((day, day))
+        day += timedelta(days=1)
+    return days
+
+
+def run_incremental(days, existing_inns):
+    """Обработка однодневных окон по порядку со сдвигом watermark после каждого обработанного дня;
+    возвращает число новых записей"""
+    watermark = get_watermark()
+    logger.info(f"Инкрементальный запуск: дни с {days[0][0].strftime('%Y-%m-%d')} по {days[-1][1].strftime('%Y-%m-%d')} "
+                f"(watermark: {watermark.strftime('%Y-%m-%d') if watermark else 'нет'})")
+    if WORKERS > 1:
+        logger.info("Инкрементальный режим обрабатывает дни по порядку одним браузером")
+
+    saved = 0
+    advance = True
+    driver = get_worker_driver()
+    for day_start, day_end in days:
+        existing_inns, day_saved = process_month(driver, day_start, day_end, existing_inns)
+        if day_saved is None:
+            # Дальше watermark не двигаем: следующий запуск начнет с необработанного дня
+            logger.warning(f"День {day_start.strftime('%Y-%m-%d')} не обработан, watermark остается прежним")
+            advance = False
+            continue
+
+        saved += day_saved
+        if advance:
+            set_watermark(day_end)
+    return saved
+
+
+def reextract():
+    """Режим пересборки: все месяцы строятся заново из кэша страниц"""
+    all_inns = InnRegistry()
     processed_count = 0
-    emails_sent = 0
-    all_inns = set()
+    month_names = []
+    for month_start, month_end in iter_months(START_MONTH, END_MONTH):
+        all_inns, month_saved = reextract_month(month_start, month_end, all_inns)
+        processed_count += month_saved
+        if month_saved:
+            month_names.append(month_start.strftime("%B %Y").lower())
+
+    if EXPORT_RESULTS and month_names:
+        export_results(month_names)
+    logger.info(f"Пересборка завершена. Компаний: {processed_count}")
+
+
+_worker_local = threading.local()
+_worker_ids = itertools.count()
+_worker_drivers = []
+_worker_lock = threading.Lock()
+
+
+def retry_dead_letters(existing_inns):
+    """Повтор отложенных ссылок и окон выдачи одним пакетом; возвращает число новых записей"""
+    items = pending_dead_letters()
+    if not items:
+        return 0
+    logger.info(f"Повторяем отложенные после сбоев: {len(items)}")
+
+    driver = get_worker_driver()
+    saved = 0
+    resolved = 0
+    for item in items:
+        if item['task'] == 'listing':
+            start_date = datetime.strptime(item['window_start'], '%Y-%m-%d')
+            end_date = datetime.strptime(item['window_end'], '%Y-%m-%d')
+            # Окно продолжается с отложенной страницы; упадет снова - отложится опять
+            if open_window(driver, start_date, end_date, item['page']):
+                links = iter_company_links(driver, start_date, end_date, start_page=item['page'])
+                saved += parse_company_links(driver, skip_known_companies(links, item['month']),
+                                             existing_inns, item['month'])
+        else:
+            saved += parse_company_links(driver, [item['url']], existing_inns, item['month'])
+        resolved += dead_letter_resolve(item['url'], item['attempts'])
+
+    logger.info(f"Повтор отложенных: успешно {resolved} из {len(items)}, новых компаний: {saved}")
+    return saved
+
+
+def get_worker_driver():
+    """Драйвер текущего потока пула (браузер запускается при первом обращении к нему)"""
+    driver = getattr(_worker_local, 'driver', None)
+    if driver is None:
+        with _worker_lock:
+            worker_id = next(_worker_ids)
+        driver = DriverManager(worker_id)
+        _worker_local.driver = driver
+        with _worker_lock:
+            _worker_drivers.append(driver)
+    return driver
+
+
+def _plan_month(start_date, end_date):
+    """Задача пула: разбить месяц на окна по размеру выдачи"""
+    if not ADAPTIVE_SHARDING:
+        return [(start_date, end_date)]
+    return plan_date_shards(get_worker_driver(), start_date, end_date)
+
+
+def _collect_window_links(start_date, end_date, chunk_queue):
+    """Задача пула: применить фильтры окна и отдавать ссылки частями по мере листания выдачи;
+    возвращает (число ссылок, выдача пролистана до конца)"""
+    key = window_key(start_date, end_date)
+    month_name = start_date.strftime("%B %Y").lower()
+    if window_done(start_date, end_date):
+        logger.info(f"Окно {key} уже обработано в прерванном запуске, пропускаем")
+        return 0, True
+    checkpoint_event('window', window=key)
+
+    driver = get_worker_driver()
+    if not open_window(driver, start_date, end_date):
+        return 0, False
+
+    total = 0
+    chunk = []
+    status = {}
+    for link in skip_known_companies(iter_window_links(driver, start_date, end_date, month_name, status),
+                                     month_name):
+        chunk.append(link)
+        total += 1
+        if len(chunk) >= LINKS_CHUNK_SIZE:
+            chunk_queue.put((key, chunk))
+            chunk = []
+    if chunk:
+        chunk_queue.put((key, chunk))
+    return total, status['complete']
+
+
+def _parse_links_chunk(company_links, existing_inns, month_name):
+    """Задача пула: распарсить часть ссылок окна"""
+    return parse_company_links(get_worker_driver(), company_links, existing_inns, month_name)
+
+
+def run_worker_pool(months, existing_inns, workers=None):
+    """Параллельная обработка пулом браузеров; возвращает число новых записей
+
+    Месяцы делятся на окна, окна листают свою выдачу, а части ссылок по мере появления разбирают свободные воркеры.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    workers = workers or WORKERS
+    saved = 0
+    window_saved = {}
+    chunks_left = {}
+    month_names = {}
+    links_done = set()
+    links_failed = set()
+    futures = {}
+    chunk_queue = queue.Queue()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker') as executor:
+        for month_start, month_end in months:
+            futures[executor.submit(_plan_month, month_start, month_end)] = ('plan', (month_start, month_end))
+
+        while futures:
+            done, _ = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            # Раздаем накопившиеся части ссылок (до обработки завершенных задач, чтобы учесть их в счетчиках)
+            while True:
+                try:
+                    key, chunk = chunk_queue.get_nowait()
+                except queue.Empty:
+                    break
+                futures[executor.submit(_parse_links_chunk, chunk, existing_inns, month_names[key])] = ('chunk', key)
+                chunks_left[key] += 1
+
+            for future in done:
+                kind, payload = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Ошибка воркера ({kind} {payload}): {str(e)}")
+                    result = {'plan': [payload], 'links': (0, False), 'chunk': 0}[kind]
+
+                if kind == 'plan':
+                    # Окна месяца становятся отдельными задачами
+                    for window_start, window_end in result:
+                        key = window_key(window_start, window_end)
+                        month_names[key] = window_start.strftime("%B %Y").lower()
+                        window_saved[key] = 0
+                        chunks_left[key] = 0
+                        futures[executor.submit(_collect_window_links, window_start, window_end, chunk_queue)] = \
+                            ('links', key)
+                    continue
+
+                key = payload
+                if kind == 'links':
+                    found, complete = result
+                    logger.info(f"Найдено {found} компаний в окне {key}")
+                    links_done.add(key)
+                    if not complete:
+                        links_failed.add(key)
+                else:
+                    window_saved[key] += result
+                    chunks_left[key] -= 1
+
+                # Все ссылки окна разобраны (записи уже в хранилище)
+                if key in links_done and chunks_left[key] == 0:
+                    window_count = window_saved.pop(key)
+                    if key in links_failed:
+                        # Остаток выдачи отложен в dead letters - окно в журнале не завершаем
+                        logger.warning(f"Окно {key} пролистано не до конца, новых компаний: {window_count}")
+                    else:
+                        checkpoint_event('window_done', window=key)
+                        logger.info(f"Окно {key} обработано, новых компаний: {window_count}")
+                    write_metrics()
+                    saved += window_count
+
+    return saved
+
+
+@dataclass(slots=True)
+class Task:
+    """Задача общей очереди: key - идентификатор для идемпотентности (окно, адрес страницы выдачи или компании)"""
+    key: str
+    kind: str  # 'window', 'page' или 'company'
+    payload: dict
+    attempts: int = 0
+
+
+# Порядок выдачи задач: сначала компании, потом страницы, потом окна - очередь не разрастается ссылками
+TASK_PRIORITY = {'company': 0, 'page': 1, 'window': 2}
+
+
+class TaskQueue(abc.ABC):
+    """Интерфейс общей очереди задач с арендой; реализации - SQLiteTaskQueue или сетевое хранилище
+
+    Узел берет задачу в аренду (lease), продлевает ее (heartbeat) и завершает (complete или fail).
+    Повторное добавление задачи с тем же ключом ничего не меняет, аренда упавшего узла истекает
+    и задачу получает другой узел. claim_inn разрешает сохранить компанию только одному узлу.
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, kind, key, payload):
+        """Добавляет задачу, если задачи с таким ключом еще нет; True - добавлена"""
+
+    @abc.abstractmethod
+    def lease(self, node_id):
+        """Свободная задача (или задача с истекшей арендой) в аренду узлу node_id; None - свободных нет"""
+
+    @abc.abstractmethod
+    def heartbeat(self, task, node_id):
+        """Продлевает аренду; False - аренда уже потеряна"""
+
+    @abc.abstractmethod
+    def complete(self, task, node_id, result=None):
+        """Отмечает задачу выполненной; False - аренда потеряна, задачей занимается другой узел"""
+
+    @abc.abstractmethod
+    def fail(self, task, node_id, error, retry_after=0):
+        """Возвращает задачу в очередь не раньше чем через retry_after секунд (или помечает failed)"""
+
+    @abc.abstractmethod
+    def claim_inn(self, inn, task, node_id):
+        """Закрепляет ИНН за узлом, пока тот держит аренду задачи; True - узел может сохранить компанию"""
+
+    @abc.abstractmethod
+    def has_open_tasks(self):
+        """Есть ли задачи, которые еще выполняются или ждут выполнения"""
+
+    @abc.abstractmethod
+    def stats(self):
+        """Число задач по состояниям"""
+
+
+class SQLiteTaskQueue(TaskQueue):
+    """Очередь задач в файле SQLite; несколько процессов и машин делят его через блокировки SQLite
+
+    Журнал rollback (не WAL): WAL не работает, если файл лежит на сетевом диске у нескольких машин.
+    Записи каждый узел сохраняет в свое хранилище. Компанию сохраняет только узел, закрепивший ее ИНН
+    с действующей арендой; дубль возможен, лишь если узел упал между сохранением и завершением задачи.
+    Поэтому хранилища узлов объединяются по ИНН, например:
+        ATTACH 'node2.sqlite3' AS node2; INSERT OR IGNORE INTO companies SELECT * FROM node2.companies;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks (key TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "priority INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "lease_owner TEXT, lease_expires REAL, available_at REAL NOT NULL DEFAULT 0, result TEXT, error TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, priority)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS claimed_inns (inn TEXT PRIMARY KEY, task_key TEXT NOT NULL, "
+                "node_id TEXT NOT NULL)")
+
+    def enqueue(self, kind, key, payload):
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO tasks (key, kind, payload, priority) VALUES (?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), TASK_PRIORITY[kind]))
+        return cursor.rowcount > 0
+
+    def lease(self, node_id):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE: выбор и захват задачи - одна транзакция, два узла не получат одну задачу
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "UPDATE tasks SET status = 'failed', error = 'аренда истекла' "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, TASK_MAX_ATTEMPTS))
+                row = self._connection.execute(
+                    "SELECT key, kind, payload, attempts FROM tasks "
+                    "WHERE ((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?)) "
+                    "ORDER BY priority, rowid LIMIT 1", (now, now)).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE key = ?", (node_id, now + TASK_LEASE_SECONDS, row[0]))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        key, kind, payload, attempts = row
+        return Task(key, kind, json.loads(payload), attempts + 1)
+
+    def _update_leased(self, sql, params, task, node_id):
+        """UPDATE задачи, только если она все еще в аренде у этого узла"""
+        with self._lock:
+            cursor = self._connection.execute(
+                f"{sql} WHERE key = ? AND lease_owner = ? AND status = 'leased'", (*params, task.key, node_id))
+        return cursor.rowcount > 0
+
+    def heartbeat(self, task, node_id):
+        return self._update_leased("UPDATE tasks SET lease_expires = ?", (time.time() + TASK_LEASE_SECONDS,),
+                                   task, node_id)
+
+    def complete(self, task, node_id, result=None):
+        return self._update_leased("UPDATE tasks SET status = 'done', result = ?, lease_expires = NULL",
+                                   (result,), task, node_id)
+
+    def fail(self, task, node_id, error, retry_after=0):
+        status = 'failed' if task.attempts >= TASK_MAX_ATTEMPTS else 'pending'
+        return self._update_leased(
+            "UPDATE tasks SET status = ?, error = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL",
+            (status, str(error)[:1000], time.time() + retry_after), task, node_id)
+
+    def claim_inn(self, inn, task, node_id):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Узел, потерявший аренду, не сохраняет: задачу уже выполняет (или выполнит) другой
+                holds_lease = self._connection.execute(
+                    "SELECT 1 FROM tasks WHERE key = ? AND lease_owner = ? AND status = 'leased' AND lease_expires >= ?",
+                    (task.key, node_id, time.time())).fetchone() is not None
+                claimed = False
+                if holds_lease:
+                    owner = self._connection.execute(
+                        "SELECT task_key FROM claimed_inns WHERE inn = ?", (inn,)).fetchone()
+                    # Та же задача после истекшей аренды прежнего узла переходит к новому арендатору
+                    claimed = owner is None or owner[0] == task.key
+                    if claimed:
+                        self._connection.execute(
+                            "INSERT INTO claimed_inns (inn, task_key, node_id) VALUES (?, ?, ?) "
+                            "ON CONFLICT (inn) DO UPDATE SET node_id = excluded.node_id", (inn, task.key, node_id))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def has_open_tasks(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM tasks WHERE status IN ('pending', 'leased') LIMIT 1").fetchone() is not None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+
+def node_id():
+    """Имя узла для аренды задач"""
+    return NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def seed_queue(task_queue, months):
+    """Задачи на окна-месяцы; повторный посев тех же месяцев ничего не добавляет"""
+    added = 0
+    for start_date, end_date in months:
+        added += task_queue.enqueue('window', window_key(start_date, end_date),
+                                    {'start': start_date.strftime('%Y-%m-%d'), 'end': end_date.strftime('%Y-%m-%d')})
+    logger.info(f"В очередь добавлено окон: {added} из {len(months)}")
+    return added
+
+
+def enqueue_page(task_queue, start_date, end_date, page):
+    """Задача на страницу выдачи окна (ключ - тот же адрес, что и в кэше)"""
+    task_queue.enqueue('page', listing_cache_url(start_date, end_date, page),
+                       {'start': start_date.strftime('%Y-%m-%d'), 'end': end_date.strftime('%Y-%m-%d'), 'page': page})
+
+
+def _run_window_task(driver, task_queue, start_date, end_date):
+    """Задача окна: разбить его по размеру выдачи и поставить первые страницы частей"""
+    windows = plan_date_shards(driver, start_date, end_date) if ADAPTIVE_SHARDING else [(start_date, end_date)]
+    for window_start, window_end in windows:
+        enqueue_page(task_queue, window_start, window_end, 1)
+    return f"{len(windows)} окон"
+
+
+def _run_page_task(driver, task_queue, start_date, end_date, page):
+    """Задача страницы выдачи: поставить компании страницы и следующую страницу"""
+    # Фильтры окна хранятся в сессии браузера; тот же узел часто берет следующую страницу того же окна
+    opened = getattr(driver, 'date_filters', None) != (start_date, end_date)
+    if opened:
+        _open_window(driver, start_date, end_date)
+
+    cache_url = listing_cache_url(start_date, end_date, page)
+    html = with_retries(
+        lambda attempt: read_listing_page(driver, page, cache_url, navigate=page > 1 or not opened or attempt > 0),
+        f"Страница выдачи {page}")
+    links, no_results = parse_listing_page(html)
+    if no_results or not links:
+        return "0 компаний"
+
+    month_name = start_date.strftime("%B %Y").lower()
+    for link in links:
+        if is_known_company(link):
+            METRICS.inc('skipped', reason='known')
+            continue
+        task_queue.enqueue('company', link, {'url': link, 'month': month_name})
+    if page < MAX_LISTING_PAGES:
+        enqueue_page(task_queue, start_date, end_date, page + 1)
+    return f"{len(links)} компаний"
+
+
+def _run_company_task(driver, task_queue, task, owner, existing_inns):
+    """Задача компании: загрузить и сохранить, если ИНН не закреплен за другой задачей; возвращает ИНН"""
+    url = task.payload['url']
+    company_data = with_retries(lambda attempt: _parse_company_page(driver, url, existing_inns), f"Компания {url}")
+    if not company_data:
+        return None
+    # Та же задача, выполненная повторно после падения узла, снова получает свой ИНН
+    if not task_queue.claim_inn(company_data.inn, task, owner):
+        METRICS.inc('skipped', reason='claimed')
+        return None
+    existing_inns.add(company_data.inn)
+    emit_record(company_data, task.payload['month'])
+    return company_data.inn
+
 
+@contextmanager
+def lease_heartbeat(task_queue, task, owner):
+    """Продление аренды задачи в фоне, пока она выполняется"""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(TASK_HEARTBEAT_SECONDS):
+            if not task_queue.heartbeat(task, owner):
+                logger.warning(f"Аренда задачи {task.key} потеряна")
+                return
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{owner}", daemon=True)
+    thread.start()
     try:
-        # Определяем месяцы для парсинга (с мая 2025 по январь 2025)
-        current_date = datetime(2025, 5, 1)
-        end_date = datetime(2025, 1, 1)
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_queue_worker(task_queue, existing_inns, owner):
+    """Цикл воркера узла: задачи из общей очереди, пока в ней есть невыполненные; возвращает число новых записей"""
+    driver = get_worker_driver()
+    saved = 0
+    while True:
+        task = task_queue.lease(owner)
+        if task is None:
+            # Задачи других узлов еще могут добавить страницы и компании
+            if not task_queue.has_open_tasks():
+                return saved
+            time.sleep(QUEUE_POLL_INTERVAL)
+            continue
+
+        logger.info(f"Задача {task.kind} (попытка {task.attempts}): {task.key}")
+        try:
+            with lease_heartbeat(task_queue, task, owner):
+                if task.kind == 'company':
+                    result = _run_company_task(driver, task_queue, task, owner, existing_inns)
+                    saved += result is not None
+                else:
+                    start_date = datetime.strptime(task.payload['start'], '%Y-%m-%d')
+                    end_date = datetime.strptime(task.payload['end'], '%Y-%m-%d')
+                    if task.kind == 'window':
+                        result = _run_window_task(driver, task_queue, start_date, end_date)
+                    else:
+                        result = _run_page_task(driver, task_queue, start_date, end_date, task.payload['page'])
+        except Exception as e:
+            logger.error(f"Ошибка задачи {task.kind} {task.key}: {str(e)}")
+            METRICS.inc('tasks', kind=task.kind, outcome='failed')
+            debug_failure(driver, f"task_{task.kind}_error")
+            # Повторы внутри задачи уже были - в очередь возвращаем с паузой, задачу может взять другой узел
+            kind = classify_failure(e)
+            retry_after = backoff_delay(kind, task.attempts) if kind in RETRY_BACKOFF else RETRY_BACKOFF_MAX
+            task_queue.fail(task, owner, e, retry_after=retry_after)
+            continue
+
+        if not task_queue.complete(task, owner, result):
+            logger.warning(f"Задача {task.key} выполнена после потери аренды")
+        METRICS.inc('tasks', kind=task.kind, outcome='done')
+
+
+def run_queue(task_queue, existing_inns, workers=None):
+    """Участие узла в общем обходе: workers браузеров берут задачи из очереди; возвращает число новых записей"""
+    from concurrent.futures import ThreadPoolExecutor
+    workers = workers or WORKERS
+    owner = node_id()
+    logger.info(f"Узел {owner}: очередь {getattr(task_queue, 'path', task_queue)}, воркеров {workers}, "
+                f"задачи: {task_queue.stats()}")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='queue') as executor:
+        futures = [executor.submit(run_queue_worker, task_queue, existing_inns, f"{owner}/{i}") for i in range(workers)]
+        saved = sum(future.result() for future in futures)
+    logger.info(f"Узел {owner}: очередь пуста, новых компаний: {saved}, задачи: {task_queue.stats()}")
+    return saved
+
+
+def main(resume=False, incremental=False, retry_only=False, queue_path=None, seed=False):
+    """Основная функция парсера (resume=True - продолжить прерванный запуск по журналу,
+    incremental=True - только дни с последней обработанной даты регистрации,
+    retry_only=True - только повтор отложенных после сбоев ссылок и окон,
+    queue_path - работать с другими узлами через общую очередь задач, seed=True - поставить в нее месяцы)"""
+    cache_evict()
+    open_checkpoint(resume)
+    processed_count = 0
+    # ИНН из индекса прошлых запусков сразу считаются обработанными
+    all_inns = InnRegistry(known_inns())
 
-        while current_date >= end_date:
-            month_start = current_date.replace(day=1)
-            month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    # Определяем месяцы для парсинга (с START_MONTH по END_MONTH) или дни с прошлого запуска
+    days = incremental_windows() if incremental else []
+    months = [] if incremental or retry_only else list(iter_months(START_MONTH, END_MONTH))
 
-            # Обрабатываем месяц
-            all_inns, month_data = process_month(driver, month_start, month_end, all_inns)
-            processed_count += len(month_data)
-            emails_sent += sum(1 for item in month_data if item['EmailSent'])
+    try:
+        if queue_path:
+            task_queue = SQLiteTaskQueue(queue_path)
+            if seed:
+                seed_queue(task_queue, months)
+            processed_count += run_queue(task_queue, all_inns, WORKERS)
+        elif incremental:
+            processed_count += run_incremental(days, all_inns)
+        elif WORKERS > 1:
+            processed_count += run_worker_pool(months, all_inns, WORKERS)
+        else:
+            driver = get_worker_driver()
+            for month_start, month_end in months:
+                # Большие месяцы делим на окна поменьше
+                windows = plan_date_shards(driver, month_start, month_end) if ADAPTIVE_SHARDING \
+                    else [(month_start, month_end)]
+
+                for window_start, window_end in windows:
+                    all_inns, window_saved = process_month(driver, window_start, window_end, all_inns)
+                    processed_count += window_saved or 0
 
-            # Переходим к предыдущему месяцу
-            current_date = month_start - timedelta(days=1)
+        # Отложенные после сбоев ссылки и окна (этого и прошлых запусков) - одним пакетом в конце;
+        # в режиме очереди сбойные задачи возвращаются в очередь, а не в dead letters
+        if (DEAD_LETTER_RETRY and not queue_path) or retry_only:
+            processed_count += retry_dead_letters(all_inns)
 
     finally:
-        driver.quit()
+        for driver in _worker_drivers:
+            driver.quit()
+        if _parse_pool is not None:
+            _parse_pool.shutdown()
+        close_checkpoint()
+        close_record_sink()
+        debug_flush()
+
+        # Выгружаем результаты, если появились новые записи, даже если запуск прервался (полная выгрузка - --export)
+        if EXPORT_RESULTS:
+            export_results(sorted_months(_run_months))
+        write_metrics()
         logger.info("Парсер завершил работу")
         logger.info(f"Обработано компаний: {processed_count}")
-        logger.info(f"Отправлено писем: {emails_sent}")
+
+
+# Параметры, которые задаются файлом конфигурации (--config, JSON с ключами как у констант) и ключами запуска
+CONFIG_KEYS = (
+    'START_MONTH', 'END_MONTH', 'WATERMARK_OVERLAP_DAYS', 'INCREMENTAL_INITIAL_DAYS',
+    'WORKERS', 'REQUESTS_PER_SECOND', 'RATE_LIMIT_BURST', 'FETCH_MODE', 'ASYNC_PIPELINE', 'FETCH_CONCURRENCY',
+    'PARSE_WORKERS', 'EXTRACTION_MODE', 'ADAPTIVE_SHARDING', 'SHARD_MAX_RESULTS', 'SHARD_MAX_PAGES',
+    'PAGE_LOAD_TIMEOUT', 'HTTP_TIMEOUT', 'WAIT_TIMEOUTS', 'MAX_RETRIES', 'RETRY_BACKOFF', 'RETRY_BACKOFF_MAX',
+    'DEAD_LETTER_RETRY', 'DEAD_LETTER_MAX_ATTEMPTS', 'MAX_LISTING_PAGES',
+    'NODE_ID', 'TASK_LEASE_SECONDS', 'TASK_HEARTBEAT_SECONDS', 'TASK_MAX_ATTEMPTS', 'QUEUE_POLL_INTERVAL',
+    'CHROME_BINARY', 'CHROMEDRIVER_PATH', 'PROFILES_DIR', 'DEBUG_PORT_BASE', 'BLOCK_RESOURCES', 'PAGE_LOAD_STRATEGY',
+    'DRIVER_RECYCLE_PAGES', 'DRIVER_MAX_RSS_MB', 'DRIVER_MAX_PAGE_LATENCY', 'DRIVER_WARM_STANDBY',
+    'STORAGE_PATH', 'EXPORT_RESULTS', 'OUTPUT_DIR', 'OUTPUT_FORMAT', 'OUTPUT_WORKBOOK', 'OUTPUT_FILENAME', 'RECORD_SINK', 'RECORD_SINK_PATH',
+    'HTML_CACHE_DIR', 'HTML_CACHE_TTL', 'HTML_CACHE_LISTING_TTL', 'HTML_CACHE_MAX_BYTES', 'KNOWN_COMPANY_MAX_AGE_DAYS',
+    'CHECKPOINT_PATH', 'METRICS_DIR', 'DEBUG_MODE', 'DEBUG_SAMPLE_RATE', 'DEBUG_DIR',
+)
+
+
+def parse_month(value):
+    """Дата из 'YYYY-MM' или 'YYYY-MM-DD'"""
+    for date_format in ('%Y-%m-%d', '%Y-%m'):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError(f"Дата должна быть в формате YYYY-MM или YYYY-MM-DD: {value}")
+
+
+def apply_config(config):
+    """Установка параметров модуля из словаря {имя параметра: значение}"""
+    settings = globals()
+    for key, value in config.items():
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"Неизвестный параметр конфигурации: {key}")
+        if key in ('START_MONTH', 'END_MONTH') and isinstance(value, str):
+            value = parse_month(value)
+        elif key in ('WAIT_TIMEOUTS', 'RETRY_BACKOFF'):
+            # Словари дополняют значения по умолчанию, а не заменяют их целиком
+            value = {**settings[key], **value}
+        elif key == 'BLOCK_RESOURCES':
+            value = tuple(value)
+        settings[key] = value
+
+    # Ожидания загрузки страниц по умолчанию следуют за таймаутом загрузки
+    if 'PAGE_LOAD_TIMEOUT' in config:
+        for step in ('filter_panel', 'listing_page', 'company_page'):
+            if step not in config.get('WAIT_TIMEOUTS', {}):
+                WAIT_TIMEOUTS[step] = PAGE_LOAD_TIMEOUT
+
+    for key, allowed in (('OUTPUT_FORMAT', ('xlsx', 'csv')), ('RECORD_SINK', ('jsonl', 'csv', None)),
+                         ('FETCH_MODE', ('http', 'browser')),
+                         ('EXTRACTION_MODE', ('python', 'js', 'verify'))):
+        if settings[key] not in allowed:
+            raise ValueError(f"{key} должен быть одним из {allowed}: {settings[key]}")
+
+
+def load_config(path):
+    """Чтение файла конфигурации JSON и применение его параметров"""
+    with open(path, encoding='utf-8') as f:
+        apply_config(json.load(f))
+    logger.info(f"Загружена конфигурация {path}")
+
+
+def current_config():
+    """Действующие параметры (для --print-config и сравнения запусков)"""
+    settings = globals()
+    return {key: settings[key].strftime('%Y-%m-%d') if isinstance(settings[key], datetime) else settings[key]
+            for key in CONFIG_KEYS}
+
+
+def cli(argv=None):
+    """Точка входа: ключи запуска переопределяют файл конфигурации, он - значения по умолчанию"""
+    arg_parser = argparse.ArgumentParser(description="Парсер компаний checko.ru")
+    arg_parser.add_argument('--config', help="файл конфигурации JSON (ключи - имена параметров, например WORKERS)")
+    arg_parser.add_argument('--print-config', action='store_true', help="вывести действующие параметры и выйти")
+    arg_parser.add_argument('--reextract', action='store_true',
+                            help="пересобрать файлы месяцев из кэша страниц без браузера")
+    arg_parser.add_argument('--export', action='store_true',
+                            help="только выгрузить все месяцы из хранилища в файлы")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="продолжить прерванный запуск с места остановки по журналу checkpoint.jsonl")
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help="только дни с последней обработанной даты регистрации (watermark) по сегодня")
+    arg_parser.add_argument('--retry-failed', action='store_true',
+                            help="только повторить ссылки и окна выдачи, отложенные после сбоев")
+    arg_parser.add_argument('--queue', help="файл общей очереди задач SQLite: несколько машин делят один обход")
+    arg_parser.add_argument('--seed', action='store_true',
+                            help="с --queue: поставить в очередь месяцы с --until по --since (повторно - без дублей)")
+
+    overrides = arg_parser.add_argument_group("параметры (переопределяют файл конфигурации)")
+    options = (
+        ('--until', 'START_MONTH', str, "самый поздний месяц, YYYY-MM (обход идет от него назад)"),
+        ('--since', 'END_MONTH', str, "самый ранний месяц, YYYY-MM"),
+        ('--overlap', 'WATERMARK_OVERLAP_DAYS', int, "сколько дней до watermark пройти заново в инкрементальном режиме"),
+        ('--workers', 'WORKERS', int, "количество браузеров-воркеров"),
+        ('--rps', 'REQUESTS_PER_SECOND', float, "лимит запросов к сайту в секунду"),
+        ('--fetch-mode', 'FETCH_MODE', str, "загрузка страниц компаний: http или browser"),
+        ('--extraction-mode', 'EXTRACTION_MODE', str, "извлечение в браузере: python, js или verify"),
+        ('--page-timeout', 'PAGE_LOAD_TIMEOUT', int, "таймаут загрузки страницы, секунд"),
+        ('--max-pages', 'MAX_LISTING_PAGES', int, "максимум страниц выдачи в одном окне"),
+        ('--chrome', 'CHROME_BINARY', str, "путь к Chrome"),
+        ('--chromedriver', 'CHROMEDRIVER_PATH', str, "путь к chromedriver"),
+        ('--storage', 'STORAGE_PATH', str, "файл хранилища SQLite"),
+        ('--output-dir', 'OUTPUT_DIR', str, "папка для выгрузки месяцев"),
+        ('--format', 'OUTPUT_FORMAT', str, "формат выгрузки: xlsx или csv"),
+        ('--node-id', 'NODE_ID', str, "имя узла в арендах задач очереди (по умолчанию хост и PID)"),
+    )
+    for flag, key, value_type, help_text in options:
+        overrides.add_argument(flag, dest=key, type=value_type, help=help_text)
+    args = arg_parser.parse_args(argv)
+
+    if args.config:
+        load_config(args.config)
+    apply_config({key: getattr(args, key) for _, key, _, _ in options if getattr(args, key) is not None})
+
+    if args.print_config:
+        print(json.dumps(current_config(), ensure_ascii=False, indent=2))
+    elif args.export:
+        export_results(stored_months())
+    elif args.reextract:
+        reextract()
+    else:
+        main(resume=args.resume, incremental=args.incremental, retry_only=args.retry_failed,
+             queue_path=args.queue, seed=args.seed)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()